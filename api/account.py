@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, Depends, status, HTTPException, Response, Request
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 from typing import List
 import api.database as database
@@ -6,18 +7,24 @@ import api.schemas as schemas
 import api.models as models
 import api.utils as utils
 import api.functions as fun
+import api.profiler as profiler
+import api.serializers as serializers
+import api.conditional as conditional
+import api.sync as sync
+import api.cache as cache
 import api.oauth2 as oauth2
 from sqlalchemy.exc import IntegrityError
-from uuid import uuid4
 
 
-router = APIRouter(tags=["Account"], prefix="/api")
+router = APIRouter(tags=["Account"], prefix="/api", route_class=profiler.ProfilingRoute)
 
 
 @router.get(
     "/account/admin/users/view", response_model=List[schemas.AccountUserOut]
 )  # For account_admin
 def get_users(
+    request: Request,
+    fields: tuple = Depends(serializers.fieldset(schemas.AccountUserOut)),
     db: Session = Depends(database.get_db),
     current_user: int = Depends(oauth2.get_current_user),
 ):
@@ -35,11 +42,27 @@ def get_users(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not permitted"
         )
 
-    users = (
-        db.query(models.User)
-        .filter(models.User.account_id == current_user.account_id)
-        .all()
-    )  # Finding all the users in this account
+    version = conditional.version(db, current_user.account_id)
+    etag = conditional.etag(version, current_user, "users", fields)
+
+    if conditional.not_modified(
+        request, etag
+    ):  # Client already has the current users, skipping the query
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+    key = cache.key("users", current_user, version, fields)
+    users = cache.get(key)
+
+    if users is None:  # Reading through to the database on a cache miss
+        users = serializers.fetch(
+            db.query(
+                *serializers.columns(models.User, schemas.AccountUserOut, fields)
+            ).filter(models.User.account_id == current_user.account_id)
+        )  # Finding all the users in this account
+
+        cache.put(key, users)
 
     fun.logger(
         account_id=str(current_user.account_id),
@@ -48,7 +71,7 @@ def get_users(
         message="Get Users -> Users Returned",
     )
 
-    return users
+    return serializers.respond(users, headers={"ETag": etag})
 
 
 @router.put("/account/admin/user/role", response_model=schemas.AccountUserUpdateOut)
@@ -96,13 +119,19 @@ def update_user_role(
                 status_code=status.HTTP_403_FORBIDDEN, detail="Not permitted"
             )
 
-    user_query = db.query(models.User).filter(
-        models.User.account_id == current_user.account_id,
-        models.User.user_name == user_account_name.user_name,
-    )  # Finding the user to change the role within the account
-    user = user_query.first()
+    updated_user = database.write_row(
+        db,
+        update(models.User.__table__)
+        .where(
+            models.User.account_id == current_user.account_id,
+            models.User.user_name == user_account_name.user_name,
+        )
+        .values(role=user_account_name.role),
+    )  # Updating the role of the user within the account
 
-    if user is None:  # Raising an error if the user is not found within this account
+    if (
+        updated_user is None
+    ):  # Raising an error if the user is not found within this account
         fun.logger(
             account_id=str(current_user.account_id),
             user_id=str(current_user.user_id),
@@ -114,9 +143,7 @@ def update_user_role(
             detail="User does not exist",
         )
 
-    user_role = {"role": user_account_name.role}
-
-    user_query.update(user_role, synchronize_session=False)  # Updating the role
+    conditional.bump_version(db, current_user.account_id)
     db.commit()  # Committing to the changes
 
     fun.logger(
@@ -126,7 +153,7 @@ def update_user_role(
         message="Update User Role -> Requested User Role Updated",
     )
 
-    return user_query.first()  # Returning the updated user details
+    return updated_user  # Returning the updated user details
 
 
 @router.post(
@@ -175,30 +202,25 @@ def add_user(
 
     user_cred.phone = str(user_cred.phone)
 
-    account = (
-        db.query(models.Account)
-        .filter(models.Account.account_id == current_user.account_id)
-        .first()
-    )  # Finding the account
-
-    acne_cat = account.account_name + "---" + user_cred.email
+    acne_cat = current_user.account_name + "---" + user_cred.email
 
     try:
-        new_user = models.User(
-            user_id=uuid4(),
-            acne=acne_cat,
-            account_id=account.account_id,
-            account_name=account.account_name,
-            user_name=user_cred.user_name,
-            email=user_cred.email,
-            phone=user_cred.phone,
-            password=hashed_password,
-            role=user_cred.role,
+        new_user = database.write_row(
+            db,
+            insert(models.User.__table__).values(
+                user_id=fun.generate_id(),
+                acne=acne_cat,
+                account_id=current_user.account_id,
+                account_name=current_user.account_name,
+                user_name=user_cred.user_name,
+                email=user_cred.email,
+                phone=user_cred.phone,
+                password=hashed_password,
+                role=user_cred.role,
+            ),
         )  # Creating a new new_user
-
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)  # Committing the changes
+        conditional.bump_version(db, current_user.account_id)
+        db.commit()  # Committing the changes
 
     except (
         IntegrityError
@@ -281,24 +303,27 @@ def delete_user(
     )
 
     if income_query.all() is not None:
+        sync.bury(db, income_query, models.Income, models.Income.trans_id)
         income_query.delete(synchronize_session=False)
-        db.commit()
 
     if expenditure_query.all() is not None:
+        sync.bury(db, expenditure_query, models.Expend, models.Expend.expend_id)
         expenditure_query.delete(synchronize_session=False)
-        db.commit()
 
     if expense_query.all() is not None:
+        sync.bury(
+            db, expense_query, models.ExpenseType, models.ExpenseType.expense_type_id
+        )
         expense_query.delete(synchronize_session=False)
-        db.commit()
 
     if token_query.all() is not None:
         token_query.delete(synchronize_session=False)
-        db.commit()
 
     # Finally deleting the user from the user's table
 
+    sync.bury(db, user_query, models.User, models.User.user_id)
     user_query.delete(synchronize_session=False)
+    conditional.bump_version(db, current_user.account_id)
     db.commit()  # Delete the user
 
     fun.logger(
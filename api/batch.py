@@ -0,0 +1,136 @@
+from fastapi import status, HTTPException, APIRouter, Depends
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+import api.schemas as schemas
+import api.oauth2 as oauth2
+import api.functions as fun
+import api.profiler as profiler
+import api.config as config
+import api.database as database
+import api.income as income
+import api.expenditure as expenditure
+import api.expense_type as expense_type
+
+### Several operations of the other routers in one request, authenticated once and committed in one transaction
+
+router = APIRouter(tags=["Batch"], prefix="/api", route_class=profiler.ProfilingRoute)
+
+max_operations = config.get_batch_max_operations()
+
+operations = {  # Operation -> handler taking the body first, body schema, response schema, status code
+    "income.add": (
+        income.add_income,
+        schemas.IncomeIn,
+        schemas.IncomeOut,
+        status.HTTP_201_CREATED,
+    ),
+    "income.edit": (
+        income.update_income,
+        schemas.IncomeUpdateIn,
+        schemas.IncomeOut,
+        status.HTTP_200_OK,
+    ),
+    "expenditure.add": (
+        expenditure.create_expenditure,
+        schemas.ExpenditureCreate,
+        schemas.ExpenditureOut,
+        status.HTTP_201_CREATED,
+    ),
+    "expenditure.edit": (
+        expenditure.update_expenditure,
+        schemas.ExpenditureUpdateIn,
+        schemas.ExpenditureOut,
+        status.HTTP_200_OK,
+    ),
+    "expense.add": (
+        expense_type.add_expense_type,
+        schemas.ExpenseTypeIn,
+        schemas.ExpenseTypeOut,
+        status.HTTP_201_CREATED,
+    ),
+    "expense.edit": (
+        expense_type.update_expense_type,
+        schemas.ExpenseTypeUpdateIn,
+        schemas.ExpenseTypeOut,
+        status.HTTP_200_OK,
+    ),
+}
+
+
+def failed(index: int, operation: schemas.BatchOperationIn, status_code: int, detail):
+    """Returns the error of the operation failing the batch, pointing at the operation"""
+
+    return HTTPException(
+        status_code=status_code,
+        detail={"index": index, "op": operation.op, "detail": detail},
+    )
+
+
+@router.post("/batch", response_model=schemas.BatchOut, status_code=status.HTTP_200_OK)
+def run_batch(
+    batch: schemas.BatchIn,
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Run the operations in order in one transaction, committing all of them or none"""
+
+    if not 0 < len(batch.operations) <= max_operations:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"A batch holds from 1 to {max_operations} operations",
+        )
+
+    bodies = []
+
+    for index, operation in enumerate(
+        batch.operations
+    ):  # Validating every operation before running any
+        if operation.op not in operations:
+            raise failed(
+                index,
+                operation,
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                f"Unknown operation, expected one of: {', '.join(operations)}",
+            )
+
+        try:
+            bodies.append(operations[operation.op][1].parse_obj(operation.body))
+
+        except ValidationError as error:
+            raise failed(
+                index, operation, status.HTTP_422_UNPROCESSABLE_ENTITY, error.errors()
+            )
+
+    results = []
+
+    with database.batch() as db:
+        for index, (operation, body) in enumerate(zip(batch.operations, bodies)):
+            handler, _, schema, status_code = operations[operation.op]
+
+            try:
+                row = handler(body, db=db, current_user=current_user)
+
+            except HTTPException as error:  # Rolling back the operations before it
+                fun.logger(
+                    account_id=str(current_user.account_id),
+                    user_id=str(current_user.user_id),
+                    log_type="w",
+                    message=f"Batch -> Operation {index} failed, batch rolled back",
+                )
+                raise failed(index, operation, error.status_code, error.detail)
+
+            results.append(
+                {
+                    "op": operation.op,
+                    "status_code": status_code,
+                    "result": jsonable_encoder(schema.parse_obj(row)),
+                }
+            )
+
+    fun.logger(
+        account_id=str(current_user.account_id),
+        user_id=str(current_user.user_id),
+        log_type="i",
+        message="Batch -> Operations Committed",
+    )
+
+    return {"results": results}
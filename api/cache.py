@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import orjson
+import threading
+import time
+import api.config as config
+
+try:
+    import redis
+except ImportError:  # Optional, only needed for the shared tier
+    redis = None
+
+### Per-account read-through cache of list responses, keyed by the change version every write of the account moves on
+
+ttl = config.get_cache_ttl()
+max_entries = config.get_cache_size()
+cache_url = config.get_cache_url()
+
+if cache_url is not None and redis is None:
+    raise ImportError("redis must be installed to use the shared cache tier")
+
+shared = redis.Redis.from_url(cache_url) if cache_url is not None else None
+
+
+class LRUCache:
+    """In-process tier evicting the least recently used entry, with a time to live per entry"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Key -> (expiry, value)
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] < time.monotonic():  # Expired
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+local = LRUCache(max_entries, ttl)
+
+
+def key(route: str, current_user, version: int, *params) -> str:
+    """Returns the cache key of the route as requested by the current user with the given parameters,
+    at the change version of the account read from the database, so no worker reads entries older than a write
+    """
+
+    return ":".join(
+        [
+            "kallabox",
+            route,
+            str(current_user.account_id),
+            str(current_user.user_id),
+            current_user.role,
+            str(version),
+            repr(params),
+        ]
+    )
+
+
+def get(key):
+    """Returns the cached rows under the key from the first tier holding them, or None"""
+
+    rows = local.get(key)
+
+    if rows is not None or shared is None:
+        return rows
+
+    try:
+        cached = shared.get(key)
+
+    except redis.RedisError:
+        return None
+
+    if cached is None:
+        return None
+
+    rows = orjson.loads(cached)
+    local.set(key, rows)  # Promoting to the in-process tier
+    return rows
+
+
+def put(key, rows: list):
+    """Caches the rows under the key in every tier"""
+
+    local.set(key, rows)
+
+    if shared is not None:
+        try:
+            shared.set(key, orjson.dumps(rows), ex=max(1, int(ttl)))
+
+        except redis.RedisError:
+            pass
@@ -0,0 +1,241 @@
+import zlib
+import api.config as config
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is used without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional, gzip is used without it
+    zstandard = None
+
+### Response compression for large bodies, compressing streamed bodies chunk by chunk
+
+minimum_size = config.get_compression_min_size()
+compressible_types = config.get_compression_types()
+
+
+class GzipCompressor:
+    def __init__(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 for a gzip header
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+compressors = {"gzip": GzipCompressor}  # Preferred last
+
+if brotli is not None:
+    compressors["br"] = BrotliCompressor
+
+if zstandard is not None:
+    compressors["zstd"] = ZstdCompressor
+
+
+def choose_encoding(accept_encoding: str):
+    """Returns the best available encoding accepted by the client, or None for identity"""
+
+    accepted = set()
+    refused = set()  # Even when * accepts the rest
+
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        params = params.replace(" ", "")
+
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:] or 0)
+
+            except ValueError:  # Malformed, as good as refused
+                quality = 0
+
+            if quality == 0:
+                refused.add(coding)
+                continue
+
+        accepted.add(coding)
+
+    for encoding in reversed(compressors):
+        if encoding not in refused and (encoding in accepted or "*" in accepted):
+            return encoding
+
+    return None
+
+
+def header(headers: list, name: bytes):
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+    return None
+
+
+def compressible(headers: list) -> bool:
+    """Whether the body of a response with these headers is compressed for clients accepting it"""
+
+    content_type = (header(headers, b"content-type") or b"").decode("latin-1")
+
+    return (
+        header(headers, b"content-encoding") is None
+        and content_type.split(";")[0].strip() in compressible_types
+    )
+
+
+def vary(headers: list) -> list:
+    """Returns the headers with Accept-Encoding added to Vary, so shared caches keep one copy per encoding"""
+
+    existing = header(headers, b"vary")
+
+    if existing is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+
+    if existing.strip() == b"*" or b"accept-encoding" in existing.lower():
+        return headers
+
+    return [
+        (key, value + b", Accept-Encoding" if key.lower() == b"vary" else value)
+        for key, value in headers
+    ]
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing allowlisted content types above a minimum size"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = header(scope["headers"], b"accept-encoding") or b""
+        encoding = choose_encoding(accept_encoding.decode("latin-1"))
+
+        if encoding is None:
+
+            async def send_identity(message):
+                if message["type"] == "http.response.start" and compressible(
+                    message.get("headers", [])
+                ):  # Sent as is, though other clients get it compressed
+                    message = {
+                        **message,
+                        "headers": vary(list(message.get("headers", []))),
+                    }
+
+                await send(message)
+
+            await self.app(scope, receive, send_identity)
+            return
+
+        start = None  # Response start, held back until the encoding is decided
+        buffered = []  # Body chunks held back while below the minimum size
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                content_length = header(headers, b"content-length")
+
+                if message["status"] in (204, 304) or not compressible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+
+                if content_length is not None and int(content_length) < minimum_size:
+                    passthrough = True
+                    await send({**message, "headers": vary(headers)})
+                    return
+
+                start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                buffered.append(message.get("body", b""))
+                size = sum(len(chunk) for chunk in buffered)
+
+                if size < minimum_size and more_body:
+                    return  # Not sure yet whether the body is worth compressing
+
+                if size < minimum_size:  # Whole body turned out small
+                    passthrough = True
+                    await send(
+                        {**start, "headers": vary(list(start.get("headers", [])))}
+                    )
+                    await send(
+                        {"type": "http.response.body", "body": b"".join(buffered)}
+                    )
+                    return
+
+                compressor = compressors[encoding]()
+                headers = [
+                    (key, value)
+                    for key, value in start.get("headers", [])
+                    if key.lower() != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers = vary(headers)
+                body = compressor.compress(b"".join(buffered))
+
+                if not more_body:  # Whole body at once, its length is known
+                    body += compressor.finish()
+                    headers.append((b"content-length", str(len(body)).encode()))
+
+                await send({**start, "headers": headers})
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+                return
+
+            body = compressor.compress(message.get("body", b""))
+
+            if not more_body:
+                body += compressor.finish()
+
+            if body or not more_body:
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,178 @@
+from collections import deque
+import asyncio
+import time
+import anyio.to_thread
+import api.config as config
+
+### Concurrency limits per route class, shedding requests that would queue past a deadline
+
+queue_timeout = config.get_queue_timeout_ms() / 1000
+adaptive = config.get_adaptive_concurrency()
+latency_target = config.get_latency_target_ms() / 1000
+
+connections = (
+    config.get_db_pool_size() + config.get_db_max_overflow()
+)  # Database connections each worker may hold
+
+auth_limit = max(
+    1, min(4, connections // 4)
+)  # bcrypt bound, more threads only contend for the CPU
+super_admin_limit = max(1, min(2, connections // 8))
+shared = max(
+    2, connections - auth_limit - super_admin_limit
+)  # Left for reads and writes, so all classes together stay within a pool of 4 or more
+
+write_limit = max(1, shared // 3)
+
+default_limits = {
+    "auth": auth_limit,
+    "reads": shared - write_limit,
+    "writes": write_limit,
+    "super_admin": super_admin_limit,
+}
+exempt_paths = (
+    "/health/",
+    "/docs",
+    "/openapi.json",
+    "/api/feed",
+)  # Probes, docs and long-lived feeds
+
+
+class Limiter:
+    """Admits up to limit requests at a time, queueing the rest in arrival order"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = float(limit)  # Fractional while adapting
+        self.max_limit = limit
+        self.in_flight = 0
+        self.waiters = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        """Waits up to timeout seconds for a slot, returning whether one was granted"""
+
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        try:
+            # The slot is handed over by release, already counted in flight
+            await asyncio.wait_for(waiter, timeout)
+            return True
+
+        except asyncio.TimeoutError:
+            return False
+
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0)  # Granted just as the request went away
+
+            raise
+
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def release(self, latency: float):
+        self.in_flight -= 1
+
+        if adaptive:
+            self.adapt(latency)
+
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+
+            if not waiter.done():  # Skipping waiters that already timed out
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def adapt(self, latency: float):
+        """Additive increase while latency is under target, multiplicative decrease above it"""
+
+        if latency > latency_target:
+            self.limit = max(1.0, self.limit * 0.9)
+
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+limits = {**default_limits, **config.get_concurrency_limits()}
+limiters = {name: Limiter(name, limit) for name, limit in limits.items()}
+
+
+def size_threadpool():
+    """Gives the threadpool room for every admitted request, so the limiters alone decide who waits"""
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, sum(limits.values()))
+
+
+def route_class(method: str, path: str):
+    """Returns the route class the request is limited by, or None if it is not limited"""
+
+    if path == "/" or path.startswith(exempt_paths):
+        return None
+
+    if path.startswith("/api/admin"):
+        return "super_admin"
+
+    if path in ("/api/login", "/api/refresh", "/api/logout"):
+        return "auth"
+
+    if method in ("GET", "HEAD"):
+        return "reads"
+
+    return "writes"
+
+
+async def shed(send):
+    """Answers with 503 and a hint on when to retry, without running the endpoint"""
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"retry-after", b"1"),
+            ],
+        }
+    )
+    await send(
+        {"type": "http.response.body", "body": b'{"detail":"Server busy, retry later"}'}
+    )
+
+
+class ConcurrencyMiddleware:
+    """ASGI middleware holding a slot of the route class limiter for the whole request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        name = (
+            route_class(scope["method"], scope["path"])
+            if scope["type"] == "http"
+            else None
+        )
+
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = limiters[name]
+
+        if not await limiter.acquire(queue_timeout):
+            await shed(send)
+            return
+
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send)
+
+        finally:
+            limiter.release(time.perf_counter() - start)
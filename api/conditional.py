@@ -0,0 +1,72 @@
+from fastapi import Request
+from functools import partial
+from sqlalchemy.orm import Session
+import hashlib
+import api.models as models
+import api.database as database
+
+### Conditional GET support through weak ETags derived from a per-account change version
+
+
+def bump_version(db: Session, account_id):
+    """Marks the data of the account as changed within the transaction making the change,
+    moving its ETags and cache keys on once the transaction commits
+    """
+
+    database.before_commit(
+        db, ("version", str(account_id)), partial(write_version, db, account_id)
+    )  # Once per transaction, locking the version row of the account only while committing
+
+
+def write_version(db: Session, account_id):
+    db.execute(
+        database.insert(models.ChangeVersion)
+        .values(account_id=account_id, version=1)
+        .on_conflict_do_update(
+            index_elements=[models.ChangeVersion.account_id],
+            set_={"version": models.ChangeVersion.version + 1},
+        )
+    )  # Creating the row on the first change of the account
+
+
+def version(db: Session, account_id) -> int:
+    """Returns the change version of the account, shared by every worker, without reading its rows"""
+
+    return (
+        db.query(models.ChangeVersion.version)
+        .filter(models.ChangeVersion.account_id == account_id)
+        .scalar()
+        or 0
+    )  # No row until the first change of the account
+
+
+def etag(version: int, current_user, resource: str, *params) -> str:
+    """Returns the weak ETag of the resource at the change version as seen by the current user"""
+
+    key = (
+        resource,
+        str(current_user.account_id),
+        str(current_user.user_id),
+        current_user.role,
+        version,
+        params,
+    )
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+    return f'W/"{digest}"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Checks whether the If-None-Match header of the request matches the ETag, using weak comparison"""
+
+    if_none_match = request.headers.get("if-none-match")
+
+    if if_none_match is None:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    return etag.removeprefix("W/") in tags
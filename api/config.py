@@ -5,6 +5,10 @@ class MissingEnvVariable(Exception):
     pass  # Creating a new child class of Exception
 
 
+class InvalidEnvVariable(Exception):
+    pass
+
+
 def get_jwt_secret() -> str:
     """Returns the jwt secret from the env variable or raises an exception if not found"""
 
@@ -109,3 +113,287 @@ def get_db_password() -> str:
 
     except KeyError:
         raise MissingEnvVariable("Environment variable for databse password not found")
+
+
+def get_debug() -> bool:
+    """Returns whether debug mode is enabled from the env variable, defaulting to False"""
+
+    return environ.get("KALLABOX_DEBUG", "false").lower() in ("1", "true", "yes")
+
+
+def get_slow_query_ms() -> float:
+    """Returns the slow query threshold in milliseconds from the env variable, defaulting to 100"""
+
+    return float(environ.get("KALLABOX_SLOW_QUERY_MS", "100"))
+
+
+def get_repeated_query_threshold() -> int:
+    """Returns how many identical statements in one request are flagged as a likely N+1 pattern, defaulting to 5"""
+
+    return int(environ.get("KALLABOX_REPEATED_QUERY_THRESHOLD", "5"))
+
+
+def get_trace_sample_rate() -> float:
+    """Returns the fraction of requests to trace from the env variable, defaulting to 0 (tracing disabled)"""
+
+    return float(environ.get("KALLABOX_TRACE_SAMPLE_RATE", "0"))
+
+
+def get_trace_exporter() -> str:
+    """Returns where finished traces are exported, either file or memory, from the env variable, defaulting to file,
+    or raises an exception for any other exporter
+    """
+
+    exporter = environ.get("KALLABOX_TRACE_EXPORTER", "file").lower()
+
+    if exporter not in ("file", "memory"):
+        raise InvalidEnvVariable(
+            f"KALLABOX_TRACE_EXPORTER must be file or memory, not {exporter}"
+        )
+
+    return exporter
+
+
+def get_trace_file() -> str:
+    """Returns the path of the trace file for the file exporter from the env variable, defaulting to logs/traces.jsonl"""
+
+    return environ.get("KALLABOX_TRACE_FILE", "logs/traces.jsonl")
+
+
+def get_trace_buffer_size() -> int:
+    """Returns how many traces the memory exporter keeps, or the file exporter holds while writing, from the env variable, defaulting to 1000"""
+
+    return int(environ.get("KALLABOX_TRACE_BUFFER_SIZE", "1000"))
+
+
+def get_compression_min_size() -> int:
+    """Returns the smallest response body in bytes worth compressing from the env variable, defaulting to 1024"""
+
+    return int(environ.get("KALLABOX_COMPRESSION_MIN_SIZE", "1024"))
+
+
+def get_compression_types() -> set:
+    """Returns the comma separated content types to compress from the env variable, defaulting to JSON and text"""
+
+    types = environ.get(
+        "KALLABOX_COMPRESSION_TYPES", "application/json,text/plain,text/csv"
+    )
+
+    return {content_type.strip() for content_type in types.split(",")}
+
+
+def get_cache_ttl() -> float:
+    """Returns how long cached responses stay valid in seconds from the env variable, defaulting to 5"""
+
+    return float(environ.get("KALLABOX_CACHE_TTL", "5"))
+
+
+def get_cache_size() -> int:
+    """Returns how many responses the in-process cache holds from the env variable, defaulting to 1024"""
+
+    return int(environ.get("KALLABOX_CACHE_SIZE", "1024"))
+
+
+def get_cache_url():
+    """Returns the redis URL of the shared cache tier from the env variable, or None to only cache in-process"""
+
+    return environ.get("KALLABOX_CACHE_URL")
+
+
+def get_db_pool_size() -> int:
+    """Returns how many connections each process keeps open to the database from the env variable, defaulting to 5"""
+
+    return int(environ.get("KALLABOX_DB_POOL_SIZE", "5"))
+
+
+def get_db_max_overflow() -> int:
+    """Returns how many connections each process may open beyond its pool from the env variable, defaulting to 10"""
+
+    return int(environ.get("KALLABOX_DB_MAX_OVERFLOW", "10"))
+
+
+def get_db_max_connections() -> int:
+    """Returns how many database connections all the workers may open together from the env variable, defaulting to 90"""
+
+    return int(environ.get("KALLABOX_DB_MAX_CONNECTIONS", "90"))
+
+
+def get_bind() -> str:
+    """Returns the address the server listens on from the env variable, defaulting to 0.0.0.0:8888"""
+
+    return environ.get("KALLABOX_BIND", "0.0.0.0:8888")
+
+
+def get_workers():
+    """Returns the number of worker processes from the env variable, or None to size them from the CPU and memory limits"""
+
+    workers = environ.get("KALLABOX_WORKERS")
+
+    return int(workers) if workers is not None else None
+
+
+def get_worker_memory_mb() -> int:
+    """Returns the memory in MB budgeted per worker process from the env variable, defaulting to 256"""
+
+    return int(environ.get("KALLABOX_WORKER_MEMORY_MB", "256"))
+
+
+def get_max_requests() -> int:
+    """Returns after how many requests a worker is recycled from the env variable, defaulting to 10000 (0 disables)"""
+
+    return int(environ.get("KALLABOX_MAX_REQUESTS", "10000"))
+
+
+def get_max_requests_jitter() -> int:
+    """Returns the random extra requests spreading worker recycling from the env variable, defaulting to 1000"""
+
+    return int(environ.get("KALLABOX_MAX_REQUESTS_JITTER", "1000"))
+
+
+def get_graceful_timeout() -> int:
+    """Returns how long workers may drain in-flight requests on shutdown in seconds from the env variable, defaulting to 30"""
+
+    return int(environ.get("KALLABOX_GRACEFUL_TIMEOUT", "30"))
+
+
+def get_concurrency_limits() -> dict:
+    """Returns the concurrency limits per route class from the env variable, eg. "auth=4,writes=8", defaulting to none"""
+
+    limits = environ.get("KALLABOX_CONCURRENCY_LIMITS", "")
+
+    return {
+        route_class.strip(): int(limit)
+        for route_class, _, limit in (
+            item.partition("=") for item in limits.split(",") if item.strip()
+        )
+    }
+
+
+def get_queue_timeout_ms() -> float:
+    """Returns how long a request may wait for a concurrency slot in milliseconds from the env variable, defaulting to 500"""
+
+    return float(environ.get("KALLABOX_QUEUE_TIMEOUT_MS", "500"))
+
+
+def get_adaptive_concurrency() -> bool:
+    """Returns whether concurrency limits adapt to the observed latency from the env variable, defaulting to False"""
+
+    return environ.get("KALLABOX_ADAPTIVE_CONCURRENCY", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+
+def get_latency_target_ms() -> float:
+    """Returns the latency above which adaptive concurrency backs off in milliseconds from the env variable, defaulting to 250"""
+
+    return float(environ.get("KALLABOX_LATENCY_TARGET_MS", "250"))
+
+
+def get_idempotency_ttl() -> float:
+    """Returns how long idempotency keys are remembered in seconds from the env variable, defaulting to 86400"""
+
+    return float(environ.get("KALLABOX_IDEMPOTENCY_TTL", "86400"))
+
+
+def get_idempotency_wait() -> float:
+    """Returns how long a duplicate request waits for the first one in seconds from the env variable, defaulting to 10"""
+
+    return float(environ.get("KALLABOX_IDEMPOTENCY_WAIT", "10"))
+
+
+def get_group_commit() -> bool:
+    """Returns whether single-row inserts are committed in groups from the env variable, defaulting to False"""
+
+    return environ.get("KALLABOX_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+
+
+def get_group_commit_window_ms() -> float:
+    """Returns how long a group waits for more inserts in milliseconds from the env variable, defaulting to 2"""
+
+    return float(environ.get("KALLABOX_GROUP_COMMIT_WINDOW_MS", "2"))
+
+
+def get_group_commit_max_rows() -> int:
+    """Returns the most inserts committed in one group from the env variable, defaulting to 64"""
+
+    return int(environ.get("KALLABOX_GROUP_COMMIT_MAX_ROWS", "64"))
+
+
+def get_group_commit_timeout() -> float:
+    """Returns how long a request waits for its insert to be taken into a group in seconds from the env variable, defaulting to 5"""
+
+    return float(environ.get("KALLABOX_GROUP_COMMIT_TIMEOUT", "5"))
+
+
+def get_events_backend() -> str:
+    """Returns how events reach the feed of every worker, "memory" or "postgres" for LISTEN/NOTIFY, from the env variable, defaulting to postgres when several workers run and memory otherwise"""
+
+    return environ.get(
+        "KALLABOX_EVENTS_BACKEND", "postgres" if (get_workers() or 1) > 1 else "memory"
+    )
+
+
+def get_event_history() -> int:
+    """Returns how many recent events per account are kept for resuming feeds from the env variable, defaulting to 1000"""
+
+    return int(environ.get("KALLABOX_EVENT_HISTORY", "1000"))
+
+
+def get_event_heartbeat() -> float:
+    """Returns the seconds between keep-alive comments on an idle feed from the env variable, defaulting to 15"""
+
+    return float(environ.get("KALLABOX_EVENT_HEARTBEAT", "15"))
+
+
+def get_sync_overlap_seconds() -> float:
+    """Returns how far sync cursors are moved back to cover transactions still committing from the env variable, defaulting to 5"""
+
+    return float(environ.get("KALLABOX_SYNC_OVERLAP_SECONDS", "5"))
+
+
+def get_sync_page_size() -> int:
+    """Returns the most rows of each kind one sync returns from the env variable, defaulting to 500"""
+
+    return int(environ.get("KALLABOX_SYNC_PAGE_SIZE", "500"))
+
+
+def get_database_url() -> str:
+    """Returns the full database URL, eg. sqlite:///kallabox.db for an embedded database, from the env variable, defaulting to None for one built from the postgres settings,
+    or raises an exception for an in-memory SQLite database
+    """
+
+    database_url = environ.get("KALLABOX_DATABASE_URL")
+
+    if (
+        database_url is not None
+        and database_url.startswith("sqlite")
+        and (
+            database_url.split("?")[0].split("://", 1)[-1] in ("", "/", "/:memory:")
+            or "mode=memory" in database_url
+        )
+    ):  # Each pooled connection would open its own empty database
+        raise InvalidEnvVariable(
+            "KALLABOX_DATABASE_URL names an in-memory SQLite database, use a file instead, eg. sqlite:///kallabox.db"
+        )
+
+    return database_url
+
+
+def get_sqlite_busy_timeout_ms() -> int:
+    """Returns how long an embedded database waits for the write lock in milliseconds from the env variable, defaulting to 5000"""
+
+    return int(environ.get("KALLABOX_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def get_name_cache_size() -> int:
+    """Returns how many account, user and payment method names each in-process lookup holds from the env variable, defaulting to 10000"""
+
+    return int(environ.get("KALLABOX_NAME_CACHE_SIZE", "10000"))
+
+
+def get_batch_max_operations() -> int:
+    """Returns how many operations a batch may hold from the env variable, defaulting to 100"""
+
+    return int(environ.get("KALLABOX_BATCH_MAX_OPERATIONS", "100"))
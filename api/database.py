@@ -1,18 +1,79 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
 import api.config as config
+import api.instrumentation as instrumentation
 
-### Database file to access and configure postgres
-db_host = config.get_db_host()
-db_name = config.get_db_name()
-db_user = config.get_db_user()
-db_pass = config.get_db_password()
+### Database file to access and configure postgres, or an embedded SQLite database
+SQLALCHEMY_DATABASE_URL = config.get_database_url()
+
+if SQLALCHEMY_DATABASE_URL is None:  # Built from the postgres settings
+    db_host = config.get_db_host()
+    db_name = config.get_db_name()
+    db_user = config.get_db_user()
+    db_pass = config.get_db_password()
+
+    SQLALCHEMY_DATABASE_URL = f"postgresql://{db_user}:{db_pass}@{db_host}/{db_name}"
+
+embedded = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+
+def configure_sqlite(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = "IMMEDIATE"  # Transactions begin at the first write, taking the write lock at once
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # Readers no longer block the writer
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={config.get_sqlite_busy_timeout_ms()}")
+    cursor.close()
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{db_user}:{db_pass}@{db_host}/{db_name}"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-)  # , connect_args={"check_same_thread": False} for sqlite
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=config.get_db_pool_size(),
+    max_overflow=config.get_db_max_overflow(),
+    connect_args={"check_same_thread": False} if embedded else {},
+)
+instrumentation.attach(engine)  # Counting and timing statements per request
+
+if embedded:
+    event.listen(engine, "connect", configure_sqlite)
+
+
+class Writes:
+    """Whether the writes of a request have committed, or might still commit after it answered"""
+
+    def __init__(self):
+        self.committed = False
+        self.in_flight = False  # Handed to another thread that has not reported back
+
+
+current_writes: ContextVar = ContextVar("current_writes", default=None)
+
+
+@event.listens_for(engine, "begin")
+def forget_writes(connection):
+    connection.info.pop("wrote", None)
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def note_write(connection, cursor, statement, parameters, context, executemany):
+    if context.isinsert or context.isupdate or context.isdelete:
+        connection.info["wrote"] = True
+
+
+@event.listens_for(engine, "commit")
+def note_commit(connection):
+    writes = current_writes.get()
+
+    if (
+        connection.info.pop("wrote", False) and writes is not None
+    ):  # Counted before the commit returns, a commit that fails may still have gone through
+        writes.committed = True
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -23,3 +84,76 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def on_commit(db: Session, callback):
+    """Runs the callback once the current transaction of the session has committed"""
+    db.info.setdefault("on_commit", []).append(callback)
+
+
+def before_commit(db: Session, key, callback):
+    """Runs the callback as part of the current transaction of the session just before it commits, once per key"""
+    db.info.setdefault("before_commit", {})[key] = callback
+
+
+def run_before_commit(session):
+    for key, callback in sorted(
+        session.info.pop("before_commit", {}).items()
+    ):  # In the same order in every transaction, so row locks taken by them never deadlock
+        callback()
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def flush_before_commit(session):
+    if session.info.get("batch"):
+        return  # Only flushed, the callbacks run before the whole batch commits
+
+    run_before_commit(session)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def run_on_commit(session):
+    if session.info.get("batch"):
+        return  # Only flushed, the callbacks wait for the whole batch
+
+    for callback in session.info.pop("on_commit", []):
+        callback()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_on_commit(session):
+    session.info.pop("before_commit", None)
+    session.info.pop("on_commit", None)
+
+
+def insert(model):
+    """Returns an insert into the model supporting ON CONFLICT in the dialect of the engine"""
+
+    return (sqlite if embedded else postgresql).insert(model)
+
+
+def write_row(db: Session, statement) -> dict:
+    """Runs the insert or update, returning the written row as a dictionary or None if no row matched"""
+
+    row = db.execute(statement.returning(*statement.table.columns)).first()
+
+    return None if row is None else row._asdict()
+
+
+@contextmanager
+def batch():
+    """Yields a session whose commits only flush, committing all of its writes at once if the block exits without error"""
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+
+        with SessionLocal(
+            bind=connection, join_transaction_mode="rollback_only", info={"batch": True}
+        ) as db:
+            yield db  # Rolled back with the connection on an error
+
+            run_before_commit(db)
+            transaction.commit()
+
+        for callback in db.info.pop("on_commit", []):
+            callback()
@@ -0,0 +1,266 @@
+from collections import deque
+from functools import partial
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+import asyncio
+import itertools
+import orjson
+import psycopg2
+import select as selectors
+import threading
+import time
+from sqlalchemy.orm import Session
+import api.config as config
+import api.database as database
+import api.functions as fun
+import api.models as models
+import api.names as names
+import api.oauth2 as oauth2
+import api.profiler as profiler
+
+### Live feed of committed income and expenditure changes per account, streamed as Server-Sent Events
+
+router = APIRouter(tags=["Feed"], prefix="/api", route_class=profiler.ProfilingRoute)
+
+backend = config.get_events_backend()
+history_size = config.get_event_history()
+heartbeat = config.get_event_heartbeat()
+channel = "kallabox_events"
+event_lock = 4243  # Advisory lock class numbering the events of each account
+queue_size = 256  # Events a subscriber may fall behind before it is dropped
+resume_window = (
+    60  # Seconds the history of an account outlives its last feed, for reconnects
+)
+
+subscribers = (
+    {}
+)  # Account id -> subscribers, for the accounts with a feed open in this worker
+history = {}  # Account id -> events, kept while the account has subscribers or just had
+idle_since = {}  # Account id -> when its last subscriber left
+lock = threading.Lock()
+last_id = 0
+sequence = itertools.count()  # Order of the events written in one transaction
+
+
+def next_id() -> int:
+    """Returns a new event id of the memory backend, increasing and close to the time in nanoseconds"""
+
+    global last_id
+
+    with lock:
+        last_id = max(time.time_ns(), last_id + 1)
+        return last_id
+
+
+class Subscriber:
+    """A connected feed, fed from any thread through its event loop"""
+
+    def __init__(self, account_id: str, user_id):
+        self.account_id = account_id
+        self.user_id = (
+            user_id  # None to receive the events of every user in the account
+        )
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.lagging = False
+
+    def deliver(self, event: dict):
+        if self.user_id is None or event["user_id"] == self.user_id:
+            self.loop.call_soon_threadsafe(self.put, event)
+
+    def put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+
+        except asyncio.QueueFull:  # The client resumes from the history on reconnecting
+            self.lagging = True
+
+
+def dispatch(event: dict):
+    """Records the event and hands it to the feeds of its account in this worker"""
+
+    with lock:
+        if event["account_id"] not in history:
+            return  # No feed of the account in this worker
+
+        history[event["account_id"]].append(event)
+        targets = list(subscribers.get(event["account_id"], ()))
+
+    for subscriber in targets:
+        subscriber.deliver(event)
+
+
+def dispatch_new(event: dict):
+    event["id"] = next_id()
+    dispatch(event)
+
+
+def notify(db: Session, event: dict):
+    """Numbers the event and notifies every worker of it, as part of the transaction of the session"""
+
+    db.execute(
+        select(
+            func.pg_advisory_xact_lock(event_lock, func.hashtext(event["account_id"]))
+        )
+    )  # Held until the transaction commits, so the ids of an account arrive in order
+    event["id"] = db.execute(select(models.event_ids.next_value())).scalar()
+    db.execute(
+        select(func.pg_notify(channel, orjson.dumps(event).decode()))
+    )  # Delivered once the transaction commits, to every worker, this one included
+
+
+def publish(event_type: str, schema, row, account_id, user_id, db: Session):
+    """Emits the change of the row, shaped like the response schema, to the feeds of the account
+    once the transaction of the session writing it commits
+    """
+
+    data = (
+        schema.parse_obj(row) if isinstance(row, dict) else schema.from_orm(row)
+    ).dict()
+    event = {
+        "type": event_type,
+        "account_id": str(account_id),
+        "user_id": str(user_id),
+        "data": data,
+    }
+
+    if backend != "postgres":
+        database.on_commit(db, partial(dispatch_new, event))
+        return
+
+    database.before_commit(
+        db, ("event", next(sequence)), partial(notify, db, event)
+    )  # Sorting before the version, as every transaction locks them in the same order
+
+
+def listen():
+    """Dispatches the events notified by every worker, reconnecting when the connection drops"""
+
+    while True:
+        try:
+            connection = psycopg2.connect(
+                database.engine.url.render_as_string(hide_password=False)
+            )
+            connection.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+            )
+            connection.cursor().execute(f"LISTEN {channel}")
+
+            while True:
+                selectors.select([connection], [], [], heartbeat)
+                connection.poll()
+
+                while connection.notifies:
+                    dispatch(orjson.loads(connection.notifies.pop(0).payload))
+
+        except psycopg2.Error as error:
+            fun.logger_db(log_type="e", message=f"Event Listener -> {error}")
+            time.sleep(1)
+
+
+if backend == "postgres":
+    threading.Thread(target=listen, name="event-listener", daemon=True).start()
+
+
+def encode(event: dict) -> bytes:
+    return (
+        f"id: {event['id']}\nevent: {event['type']}\ndata: ".encode()
+        + orjson.dumps(event["data"])
+        + b"\n\n"
+    )
+
+
+def publish_row(event_type: str, schema, db: Session, row: dict):
+    """Adds the names to the row written by the session and publishes it with the transaction"""
+
+    names.add_names(db, row)
+    publish(event_type, schema, row, row["account_id"], row["user_id"], db)
+
+
+def prune(account_id: str):
+    """Drops the history of an account whose feeds all closed more than the resume window ago"""
+
+    with lock:
+        if (
+            not subscribers.get(account_id)
+            and time.monotonic() - idle_since.get(account_id, 0) >= resume_window
+        ):
+            subscribers.pop(account_id, None)
+            history.pop(account_id, None)
+            idle_since.pop(account_id, None)
+
+
+async def stream(subscriber: Subscriber, last_event_id: int):
+    """Yields the events missed since the last event id, then live events as they are committed,
+    or a resync event when this worker holds no history to resume from
+    """
+
+    account_id = subscriber.account_id
+
+    with lock:
+        kept = account_id in history
+        subscribers.setdefault(account_id, set()).add(subscriber)
+        events = history.setdefault(account_id, deque(maxlen=history_size))
+        missed = [
+            event for event in events if event["id"] > last_event_id
+        ]  # Taken with the subscription, so each event is either missed or live
+
+    try:
+        yield b"retry: 3000\n\n"
+
+        if last_event_id and not kept:  # The client catches up through /sync instead
+            yield b"event: resync\ndata: {}\n\n"
+
+        for event in missed:
+            if subscriber.user_id is None or event["user_id"] == subscriber.user_id:
+                yield encode(event)
+
+        while not subscriber.lagging:  # Cancelled when the client disconnects
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+
+            yield encode(event)
+
+    finally:
+        with lock:
+            subscribers[account_id].discard(subscriber)
+
+            if not subscribers[account_id]:
+                idle_since[account_id] = time.monotonic()
+                subscriber.loop.call_later(resume_window + 1, prune, account_id)
+
+
+@router.get("/feed")
+async def feed(
+    last_event_id: int = Header(0),
+    since: int = Query(
+        None, description="Last event id seen, for clients that cannot set headers"
+    ),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Streams the income and expenditure changes visible to the current user"""
+
+    subscriber = Subscriber(
+        str(current_user.account_id),
+        None
+        if fun.verify_user_role(current_user.role, "account_admin")
+        else str(current_user.user_id),
+    )
+
+    fun.logger(
+        account_id=str(current_user.account_id),
+        user_id=str(current_user.user_id),
+        log_type="i",
+        message="Feed -> Feed Opened",
+    )
+
+    return StreamingResponse(
+        stream(subscriber, since if since is not None else last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
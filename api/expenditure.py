@@ -1,14 +1,24 @@
 from fastapi import status, HTTPException, APIRouter, Depends
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
+from functools import partial
 from typing import List
 import api.models as models
 import api.schemas as schemas
 import api.oauth2 as oauth2
 import api.functions as fun
-from api.database import get_db
-from uuid import uuid4
-
-router = APIRouter(tags=["Expenditure"], prefix="/api")
+import api.profiler as profiler
+import api.serializers as serializers
+import api.conditional as conditional
+import api.group_commit as group_commit
+import api.events as events
+import api.names as names
+import api.filters as filters
+from api.database import get_db, write_row
+
+router = APIRouter(
+    tags=["Expenditure"], prefix="/api", route_class=profiler.ProfilingRoute
+)
 
 
 @router.get(
@@ -17,30 +27,39 @@ router = APIRouter(tags=["Expenditure"], prefix="/api")
     status_code=status.HTTP_200_OK,
 )
 def get_expenditure(
-    db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)
+    fields: tuple = Depends(serializers.fieldset(schemas.ExpenditureOut)),
+    listing: filters.Listing = Depends(filters.listing(filters.expenditure)),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
 ):
     """Get all expenditures"""
     if fun.verify_user_role(
         current_user.role, "user"
     ):  # User only gets to see his or her entries
-        expenditures = (
-            db.query(models.Expend)
+        expenditures = serializers.fetch(
+            db.query(
+                *serializers.columns(models.Expend, schemas.ExpenditureOut, fields)
+            )
             .filter(
                 models.Expend.user_id == current_user.user_id,
                 models.Expend.account_id == current_user.account_id,
+                *listing.criteria,
             )
-            .all()
+            .order_by(*listing.order)
         )
 
     if fun.verify_user_role(
         current_user.role, "account_admin"
     ):  # Account admin can see all the entries
-        expenditures = (
-            db.query(models.Expend)
+        expenditures = serializers.fetch(
+            db.query(
+                *serializers.columns(models.Expend, schemas.ExpenditureOut, fields)
+            )
             .filter(
                 models.Expend.account_id == current_user.account_id,
+                *listing.criteria,
             )
-            .all()
+            .order_by(*listing.order)
         )
 
     if not expenditures:  # Expenditures pertaining to this account is not found
@@ -62,7 +81,34 @@ def get_expenditure(
         message="Get Expenditure -> Returning Requested Expenditures",
     )
 
-    return expenditures
+    return serializers.respond(expenditures)
+
+
+def find_expense_type(db: Session, current_user, expense: str):
+    """Returns the id of the expense type of the account with the name, creating it if it does not exist"""
+
+    exp = fun.convert_to_valid_name(expense)
+    expense_type_id = (
+        db.query(models.ExpenseType.expense_type_id)
+        .filter(
+            models.ExpenseType.expense_type == exp,
+            models.ExpenseType.account_id == current_user.account_id,
+        )
+        .scalar()
+    )  # Getting the expense type if it exists
+
+    if expense_type_id is None:  # Creating it in the transaction of the expenditure
+        expense_type_id = fun.generate_id()
+        db.execute(
+            insert(models.ExpenseType.__table__).values(
+                account_id=current_user.account_id,
+                user_id=current_user.user_id,
+                expense_type_id=expense_type_id,
+                expense_type=exp,
+            )
+        )
+
+    return expense_type_id
 
 
 @router.post(
@@ -76,50 +122,33 @@ def create_expenditure(
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Add expenditure to the database"""
-    exp = fun.convert_to_valid_name(expend.expense)
-    expense_type_object_query = db.query(models.ExpenseType).filter(
-        models.ExpenseType.expense_type == exp,
-        models.ExpenseType.account_id == current_user.account_id,
-    )
-    expense_type_object = (
-        expense_type_object_query.first()
-    )  # Getting the expense type object if it exists
-
-    expense_dict = {"expense_type": exp}
-
-    if (
-        expense_type_object is None
-    ):  # Creating a new one if expense type object does not exist and storing it in the database
-        expense_type_id = uuid4()
-        new_expense = models.ExpenseType(
-            account_id=current_user.account_id,
-            account_name=current_user.account_name,
-            user_id=current_user.user_id,
-            user_name=current_user.user_name,
-            expense_type_id=expense_type_id,
-            **expense_dict,
-        )
-        db.add(new_expense)
-        db.commit()
-        db.refresh(new_expense)
+    expense_type_id = find_expense_type(db, current_user, expend.expense)
 
-    else:
-        expense_type_id = (
-            expense_type_object.expense_type_id
-        )  # Taking the expense type id from either the newly created one or the old one
-
-    new_expend = models.Expend(
+    expend_dict = dict(
         account_id=current_user.account_id,
-        account_name=current_user.account_name,
         user_id=current_user.user_id,
-        user_name=current_user.user_name,
-        expend_id=uuid4(),
+        expend_id=fun.generate_id(),
         amount=expend.amount,
         expense_type_id=expense_type_id,
     )
-    db.add(new_expend)
-    db.commit()
-    db.refresh(new_expend)  # Adding the expenditure to the database
+
+    if group_commit.active(db):  # Committed together with concurrent inserts
+        db.commit()  # A new expense type goes first
+        new_expend = group_commit.insert_row(
+            models.Expend,
+            expend_dict,
+            partial(events.publish_row, "expenditure.created", schemas.ExpenditureOut),
+        )  # Published within the transaction of the group
+
+    else:
+        new_expend = write_row(
+            db, insert(models.Expend.__table__).values(**expend_dict)
+        )  # Adding the expenditure to the database, returning it as stored
+        events.publish_row(
+            "expenditure.created", schemas.ExpenditureOut, db, new_expend
+        )
+        conditional.bump_version(db, current_user.account_id)
+        db.commit()
 
     fun.logger(
         account_id=str(current_user.account_id),
@@ -142,84 +171,57 @@ def update_expenditure(
     current_user: int = Depends(oauth2.get_current_user),
 ):
     "Update the wrongly entered expenditure using expend_id as id and amount"
-    expend_query = db.query(models.Expend).filter(
-        models.Expend.expend_id == expenditure_update.expend_id
-    )
-    expend = expend_query.first()  # Checking for the expenditure object
-
-    if expend is None:  # if expenditure object is not found for this user
-        fun.logger(
-            account_id=str(current_user.account_id),
-            user_id=str(current_user.user_id),
-            log_type="w",
-            message="Update Expenditure -> Expenditure for this user does not exist",
+    updated_expend = write_row(
+        db,
+        update(models.Expend.__table__)
+        .where(
+            models.Expend.expend_id == expenditure_update.expend_id,
+            *fun.scope(models.Expend, current_user),
         )
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Expenditure with id: {expenditure_update.expend_id} does not exist",
+        .values(
+            expense_type_id=find_expense_type(
+                db, current_user, expenditure_update.expense
+            ),
+            amount=expenditure_update.amount,
+        ),
+    )  # Updating the expenditure only if it is within the scope of the current user
+
+    if updated_expend is None:  # Telling a missing expenditure from one of someone else
+        expend = (
+            db.query(models.Expend.expend_id)
+            .filter(models.Expend.expend_id == expenditure_update.expend_id)
+            .first()
         )
-    if fun.verify_user_role(current_user.role, "user"):
-        if (
-            expend.user_id != current_user.user_id
-            or current_user.account_id != expend.account_id
-        ):
-            fun.logger(
-                account_id=str(current_user.account_id),
-                user_id=str(current_user.user_id),
-                log_type="w",
-                message="Update Expenditure -> User not permitted",
-            )
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform requested action",
-            )
 
-    if fun.verify_user_role(current_user.role, "account_admin"):
-        if expend.account_id != current_user.account_id:
+        if expend is None:  # if expenditure object is not found for this user
             fun.logger(
                 account_id=str(current_user.account_id),
                 user_id=str(current_user.user_id),
                 log_type="w",
-                message="Update Expenditure -> Not an Account Administrator",
+                message="Update Expenditure -> Expenditure for this user does not exist",
             )
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform requested action",
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Expenditure with id: {expenditure_update.expend_id} does not exist",
             )
 
-    exp = fun.convert_to_valid_name(expenditure_update.expense)
-    expense_type = (
-        db.query(models.ExpenseType)
-        .filter(models.ExpenseType.expense_type == exp)
-        .first()
-    )  # Finding an existing one
-
-    if (
-        expense_type is None
-    ):  # Creating a new expense type object and storing it in the database if it does not exist
-        new_expense = models.ExpenseType(
-            account_id=current_user.account_id,
-            account_name=current_user.account_name,
-            user_id=current_user.user_id,
-            user_name=current_user.user_name,
-            expense_type_id=uuid4(),
-            expense_type=exp,
+        fun.logger(
+            account_id=str(current_user.account_id),
+            user_id=str(current_user.user_id),
+            log_type="w",
+            message="Update Expenditure -> User not permitted"
+            if fun.verify_user_role(current_user.role, "user")
+            else "Update Expenditure -> Not an Account Administrator",
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to perform requested action",
         )
-        db.add(new_expense)
-        db.commit()
-        db.refresh(new_expense)
-
-        expense_type_id = new_expense.expense_type_id
-
-    else:
-        expense_type_id = expense_type.expense_type_id
-
-    updated_expenditure_dictionary = {
-        "expense_type_id": expense_type_id,
-        "amount": expenditure_update.amount,
-    }
-    expend_query.update(updated_expenditure_dictionary, synchronize_session=False)
 
+    events.publish_row(
+        "expenditure.updated", schemas.ExpenditureOut, db, updated_expend
+    )
+    conditional.bump_version(db, current_user.account_id)
     db.commit()  # Updating the expenditure
     fun.logger(
         account_id=str(current_user.account_id),
@@ -228,4 +230,4 @@ def update_expenditure(
         message="Update Expenditure -> Expenditure Updated",
     )
 
-    return expend_query.first()
+    return updated_expend
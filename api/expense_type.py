@@ -1,44 +1,74 @@
-from fastapi import status, HTTPException, APIRouter, Depends
+from fastapi import status, HTTPException, APIRouter, Depends, Request, Response
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 from typing import List
 import api.models as models
 import api.schemas as schemas
 import api.oauth2 as oauth2
 import api.functions as fun
-from api.database import get_db
-from uuid import uuid4
-
-router = APIRouter(tags=["Expense Type"], prefix="/api")
+import api.profiler as profiler
+import api.serializers as serializers
+import api.conditional as conditional
+import api.cache as cache
+import api.names as names
+from api.database import get_db, write_row
+
+router = APIRouter(
+    tags=["Expense Type"], prefix="/api", route_class=profiler.ProfilingRoute
+)
 
 
 @router.get("/expense/view", response_model=List[schemas.ExpenseTypeOut])
 def get_expense_type(
-    db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)
+    request: Request,
+    fields: tuple = Depends(serializers.fieldset(schemas.ExpenseTypeOut)),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
 ):
     """Get all the expense types from the database"""
 
-    if fun.verify_user_role(
-        current_user.role, "user"
-    ):  # Verifying whether the current token bearer is a user and not an account_admin. Token bearer will be returned expense types pertaining to the ones added by the bearer.
-        expense_types = (
-            db.query(models.ExpenseType)
-            .filter(
-                models.ExpenseType.user_id == current_user.user_id,
-                models.ExpenseType.account_id == current_user.account_id,
-            )
-            .all()
+    version = conditional.version(db, current_user.account_id)
+    etag = conditional.etag(version, current_user, "expense_type", fields)
+
+    if conditional.not_modified(
+        request, etag
+    ):  # Client already has the current expense types, skipping the query
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
         )
 
-    if fun.verify_user_role(
-        current_user.role, "account_admin"
-    ):  # Verifying whether the current token bearer is an account_admin and will be returned expense types pertaining to that account.
-        expense_types = (
-            db.query(models.ExpenseType)
-            .filter(
-                models.ExpenseType.account_id == current_user.account_id,
+    key = cache.key("expense_type", current_user, version, fields)
+    expense_types = cache.get(key)
+
+    if expense_types is None:  # Reading through to the database on a cache miss
+        if fun.verify_user_role(
+            current_user.role, "user"
+        ):  # Verifying whether the current token bearer is a user and not an account_admin. Token bearer will be returned expense types pertaining to the ones added by the bearer.
+            expense_types = serializers.fetch(
+                db.query(
+                    *serializers.columns(
+                        models.ExpenseType, schemas.ExpenseTypeOut, fields
+                    )
+                ).filter(
+                    models.ExpenseType.user_id == current_user.user_id,
+                    models.ExpenseType.account_id == current_user.account_id,
+                )
             )
-            .all()
-        )
+
+        if fun.verify_user_role(
+            current_user.role, "account_admin"
+        ):  # Verifying whether the current token bearer is an account_admin and will be returned expense types pertaining to that account.
+            expense_types = serializers.fetch(
+                db.query(
+                    *serializers.columns(
+                        models.ExpenseType, schemas.ExpenseTypeOut, fields
+                    )
+                ).filter(
+                    models.ExpenseType.account_id == current_user.account_id,
+                )
+            )
+
+        cache.put(key, expense_types)
 
     if not expense_types:  # Raising an error if expense types is not found
         fun.logger(
@@ -59,7 +89,9 @@ def get_expense_type(
         message="Get Expense Type -> Requested Expense Types Returned",
     )
 
-    return expense_types  # Returning all the expense types
+    return serializers.respond(
+        expense_types, headers={"ETag": etag}
+    )  # Returning all the expense types
 
 
 @router.post(
@@ -102,17 +134,18 @@ def add_expense_type(
             detail="Expense Type already exists",
         )
 
-    new_expense = models.ExpenseType(
-        account_id=current_user.account_id,
-        account_name=current_user.account_name,
-        user_id=current_user.user_id,
-        user_name=current_user.user_name,
-        expense_type_id=uuid4(),
-        **expense.dict(),
+    new_expense = write_row(
+        db,
+        insert(models.ExpenseType.__table__).values(
+            account_id=current_user.account_id,
+            user_id=current_user.user_id,
+            expense_type_id=fun.generate_id(),
+            **expense.dict(),
+        ),
     )
-    db.add(new_expense)
-    db.commit()
-    db.refresh(new_expense)  # Creating and adding a new expense type
+    conditional.bump_version(db, current_user.account_id)
+    db.commit()  # Creating and adding a new expense type
+    names.add_names(db, new_expense)
 
     fun.logger(
         account_id=str(current_user.account_id),
@@ -134,64 +167,68 @@ def update_expense_type(
 ):
     """Update a wrongly entered expense type in the database using the transaction id as id and expense type"""
 
-    expense_type_query = db.query(models.ExpenseType).filter(
-        models.ExpenseType.expense_type_id == expense_update.expense_type_id
-    )
-    expense_type = expense_type_query.first()  # Getting the expense type query
-
     exp = fun.convert_to_valid_name(expense_update.expense_type)
     expense_update.expense_type = exp
 
-    if expense_type is None:  # If expense type does not exist
-        fun.logger(
-            account_id=str(current_user.account_id),
-            user_id=str(current_user.user_id),
-            log_type="w",
-            message="Update Expense Type -> Expense Type for this user does not exist",
+    updated_expense = write_row(
+        db,
+        update(models.ExpenseType.__table__)
+        .where(
+            models.ExpenseType.expense_type_id == expense_update.expense_type_id,
+            *fun.scope(models.ExpenseType, current_user),
         )
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Expense Type with id: {expense_update.expense_type_id} does not exist",
+        .values(expense_type=exp),
+    )  # Updating the expense type only if it is within the scope of the current user
+
+    if (
+        updated_expense is None
+    ):  # Telling a missing expense type from one of someone else
+        expense_type = (
+            db.query(models.ExpenseType.expense_type_id)
+            .filter(
+                models.ExpenseType.expense_type_id == expense_update.expense_type_id
+            )
+            .first()
         )
-    if fun.verify_user_role(
-        current_user.role, "user"
-    ):  # Refraining an user from updating expense types
-        if (
-            expense_type.user_id != current_user.user_id
-            or expense_type.account_id != current_user.account_id
-        ):
+
+        if expense_type is None:  # If expense type does not exist
             fun.logger(
                 account_id=str(current_user.account_id),
                 user_id=str(current_user.user_id),
                 log_type="w",
-                message="Update Expense Type -> User not permitted to perform requested action",
+                message="Update Expense Type -> Expense Type for this user does not exist",
             )
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform the requested action",
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Expense Type with id: {expense_update.expense_type_id} does not exist",
             )
 
-    if fun.verify_user_role(current_user.role, "account_admin"):
-        if (
-            expense_type.account_id != current_user.account_id
-        ):  # Preventing an Account Administrator from changing other accounts' expense types
+        if fun.verify_user_role(
+            current_user.role, "user"
+        ):  # Refraining an user from updating expense types
+            fun.logger(
+                account_id=str(current_user.account_id),
+                user_id=str(current_user.user_id),
+                log_type="w",
+                message="Update Expense Type -> User not permitted to perform requested action",
+            )
+
+        else:  # Preventing an Account Administrator from changing other accounts' expense types
             fun.logger(
                 account_id=str(current_user.account_id),
                 user_id=str(current_user.user_id),
                 log_type="c",
                 message="Update Expense Type -> Account Administrator trying to alter the entries of another account",
             )
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform the requested action",
-            )
 
-    update_expense_dict = {
-        "expense_type_id": expense_update.expense_type_id,
-        "expense_type": exp,
-    }
-    expense_type_query.update(update_expense_dict, synchronize_session=False)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to perform the requested action",
+        )
+
+    conditional.bump_version(db, current_user.account_id)
     db.commit()  # Updating the expense type
+    names.add_names(db, updated_expense)
 
     fun.logger(
         account_id=str(current_user.account_id),
@@ -199,4 +236,4 @@ def update_expense_type(
         log_type="i",
         message="Update Expense Type -> Expense Type Updated",
     )
-    return expense_type_query.first()
+    return updated_expense
@@ -0,0 +1,213 @@
+from datetime import datetime
+from fastapi import HTTPException, Query, status
+from sqlalchemy import select
+from typing import List
+from uuid import UUID
+import operator
+import re
+import api.functions as fun
+import api.models as models
+
+### Filter and sort grammar of the list endpoints, compiled to parameterised SQL
+### eg. ?filter=amount>=100&filter=method=in:cash,card&filter=user=alice&sort=-amount
+
+condition = re.compile(r"^(?P<field>[a-z_]+)(?P<operator>>=|<=|!=|=|>|<)(?P<value>.+)$")
+max_values = 100  # Values in one in: list
+comparisons = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+equality = ("=", "!=")
+
+
+def boolean(value: str) -> bool:
+    if value not in ("true", "false"):
+        raise ValueError(value)
+
+    return value == "true"
+
+
+class Field:
+    """A filterable field of a list, the column it compiles to and how its values are parsed"""
+
+    def __init__(self, column, parse, operators=equality, names=None):
+        self.column = column
+        self.parse = parse
+        self.operators = operators
+        self.names = names  # (id column, name column) of the table naming the ids the column holds
+
+    def compile(self, operator: str, values: list):
+        if (
+            self.names is not None
+        ):  # Matching the ids of the names within the same statement
+            id_column, name_column = self.names
+            matched = self.column.in_(select(id_column).where(name_column.in_(values)))
+
+        elif len(values) > 1:
+            matched = self.column.in_(values)
+
+        else:
+            return comparisons[operator](self.column, values[0])
+
+        return matched if operator == "=" else ~matched
+
+
+def fields_of(model, **fields) -> dict:
+    """Returns the fields every fact table is filtered by, with the given ones of the model"""
+
+    return {
+        "account": Field(
+            model.account_id,
+            str,
+            names=(models.Account.account_id, models.Account.account_name),
+        ),
+        "user": Field(
+            model.user_id, str, names=(models.User.user_id, models.User.user_name)
+        ),
+        "timestamp": Field(model.timestamp, datetime.fromisoformat, tuple(comparisons)),
+        **fields,
+    }
+
+
+income = fields_of(
+    models.Income,
+    trans_id=Field(models.Income.trans_id, UUID),
+    amount=Field(models.Income.amount, int, tuple(comparisons)),
+    method=Field(
+        models.Income.method_id,
+        str,
+        names=(models.PaymentMethod.method_id, models.PaymentMethod.method),
+    ),
+    status=Field(models.Income.status, boolean),
+)
+expenditure = fields_of(
+    models.Expend,
+    expend_id=Field(models.Expend.expend_id, UUID),
+    amount=Field(models.Expend.amount, int, tuple(comparisons)),
+    expense_type_id=Field(models.Expend.expense_type_id, UUID),
+    expense_type=Field(
+        models.Expend.expense_type_id,
+        fun.convert_to_valid_name,  # Stored the way the names are entered
+        names=(models.ExpenseType.expense_type_id, models.ExpenseType.expense_type),
+    ),
+    status=Field(models.Expend.status, boolean),
+)
+expense_type = fields_of(
+    models.ExpenseType,
+    expense_type_id=Field(models.ExpenseType.expense_type_id, UUID),
+    expense_type=Field(models.ExpenseType.expense_type, fun.convert_to_valid_name),
+)
+
+
+def index_backed(column, scope: tuple) -> bool:
+    """Whether an index of the table returns the rows within the scope in the order of the column"""
+
+    table = column.table
+
+    for index in [table.primary_key, *table.indexes]:
+        names = [indexed.name for indexed in index.columns]
+
+        if names[: len(scope) + 1] == [*scope, column.name]:
+            return True
+
+    return False
+
+
+class Listing:
+    """Compiled filters and sort of a list request, with the key telling requests for other rows apart"""
+
+    def __init__(self, criteria: list, order: list, key: tuple):
+        self.criteria = criteria
+        self.order = order
+        self.key = key
+
+
+def invalid(detail: str):
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail
+    )
+
+
+def listing(fields: dict, scope: tuple = ("account_id",)):
+    """Returns a dependency parsing the filter and sort query parameters into a listing over the fields,
+    allowing only the sorts an index backs for rows within the scope columns
+    """
+
+    sortable = [
+        name
+        for name, field in fields.items()
+        if field.names is None and index_backed(field.column, scope)
+    ]
+
+    def parse(
+        conditions: List[str] = Query(
+            None,
+            alias="filter",
+            description="Conditions the rows must all meet, eg. amount>=100 or method=in:cash,card",
+        ),
+        sort: str = Query(
+            None,
+            description=f"Field to order by, descending when prefixed with -, one of: {', '.join(sortable)}",
+        ),
+    ) -> Listing:
+        criteria = []
+
+        for text in conditions or []:
+            parsed = condition.match(text)
+
+            if parsed is None or parsed["field"] not in fields:
+                raise invalid(
+                    f"Invalid filter: {text}, expected a field of {', '.join(fields)}, an operator and a value"
+                )
+
+            field = fields[parsed["field"]]
+            value = parsed["value"]
+
+            if parsed["operator"] not in field.operators:
+                raise invalid(
+                    f"Invalid filter: {text}, {parsed['field']} only supports {' '.join(field.operators)}"
+                )
+
+            if value.startswith("in:"):  # eg. in:cash,card
+                if parsed["operator"] not in equality:
+                    raise invalid(f"Invalid filter: {text}, in: only goes with = or !=")
+
+                value = value[len("in:") :]
+                raw_values = [item for item in value.split(",") if item]
+
+            else:
+                raw_values = [value]
+
+            if not 0 < len(raw_values) <= max_values:
+                raise invalid(
+                    f"Invalid filter: {text}, expected 1 to {max_values} values"
+                )
+
+            try:
+                values = [field.parse(raw) for raw in raw_values]
+
+            except ValueError:
+                raise invalid(f"Invalid filter: {text}, invalid value")
+
+            criteria.append(field.compile(parsed["operator"], values))
+
+        order = []
+
+        if sort is not None:
+            name = sort[1:] if sort.startswith("-") else sort
+
+            if name not in sortable:
+                raise invalid(
+                    f"Invalid sort: {sort}, expected one of: {', '.join(sortable)}"
+                )
+
+            column = fields[name].column
+            order.append(column.desc() if sort.startswith("-") else column.asc())
+
+        return Listing(criteria, order, (tuple(conditions or ()), sort))
+
+    return parse
@@ -1,9 +1,15 @@
 from fastapi import status, HTTPException
+from uuid import UUID
+import os
 import random
 import logging
+import threading
+import time
+import api.tracing as tracing
 
 user_path = "logs/user.logs"
 sa_path = "logs/admin.logs"
+db_path = "logs/db.logs"
 
 
 def check_account_name(name: str):
@@ -33,6 +39,51 @@ def create_refresh_token():
     return refresh_token
 
 
+class TimeOrderedIds:
+    """UUIDs leading with their creation time in milliseconds, like version 7 but marked version 4 for the UUID4 validators"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.millis = 0
+        self.sequence = 0
+
+    def next(self) -> UUID:
+        millis = time.time_ns() // 1000000
+
+        with self.lock:
+            if millis > self.millis:
+                self.millis = millis
+                self.sequence = random.getrandbits(
+                    10
+                )  # Random start, leaving room to count up within the millisecond
+
+            else:  # Same millisecond or the clock went back, counting up from the last id
+                self.sequence += 1
+
+                if self.sequence > 0xFFF:  # Borrowing the next millisecond
+                    self.millis += 1
+                    self.sequence = 0
+
+            millis, sequence = self.millis, self.sequence
+
+        return UUID(
+            int=millis << 80
+            | 0x4 << 76  # Version
+            | sequence << 64
+            | 0x2 << 62  # RFC 4122 variant
+            | int.from_bytes(os.urandom(8)) >> 2
+        )
+
+
+ids = TimeOrderedIds()
+
+
+def generate_id() -> UUID:
+    """Returns a new primary key, sorting after the ones generated before it so inserts append to the index"""
+
+    return ids.next()
+
+
 def verify_user_role(given, to_check):
     """Given is the user role and to_check is the one it needs to be compared with and checked."""
 
@@ -53,6 +104,19 @@ def verify_user_role(given, to_check):
         return True
 
 
+def scope(model, current_user) -> list:
+    """Returns the filters limiting the model to the rows the current user may see or change"""
+
+    filters = [model.account_id == current_user.account_id]
+
+    if verify_user_role(
+        current_user.role, "user"
+    ):  # User only gets his or her own entries
+        filters.append(model.user_id == current_user.user_id)
+
+    return filters
+
+
 def convert_to_valid_name(name: str):
     """Function used to convert the expense types' names to valid ones"""
     return name.upper().replace(
@@ -71,17 +135,18 @@ def logger(account_id: str, user_id: str, log_type: str, message: str):
     )  # Configuring the logger
     logger = logging.getLogger("apiserver")
 
-    if log_type == "i":  # INFO
-        logger.info(msg=message, extra=dictionary)
+    with tracing.span("log.write"):
+        if log_type == "i":  # INFO
+            logger.info(msg=message, extra=dictionary)
 
-    elif log_type == "w":  # WARNING
-        logger.warning(msg=message, extra=dictionary)
+        elif log_type == "w":  # WARNING
+            logger.warning(msg=message, extra=dictionary)
 
-    elif log_type == "e":  # ERROR
-        logger.error(msg=message, extra=dictionary)
+        elif log_type == "e":  # ERROR
+            logger.error(msg=message, extra=dictionary)
 
-    elif log_type == "c":  # CRITICAL
-        logger.critical(msg=message, extra=dictionary)
+        elif log_type == "c":  # CRITICAL
+            logger.critical(msg=message, extra=dictionary)
 
 
 def logger_sa(log_type: str, message: str):
@@ -94,6 +159,34 @@ def logger_sa(log_type: str, message: str):
     )  # Configuring the logger
     logger = logging.getLogger("saserver")
 
+    with tracing.span("log.write"):
+        if log_type == "i":  # INFO
+            logger.info(msg=message)
+
+        elif log_type == "w":  # WARNING
+            logger.warning(msg=message)
+
+        elif log_type == "e":  # ERROR
+            logger.error(msg=message)
+
+        elif log_type == "c":  # CRITICAL
+            logger.critical(msg=message)
+
+
+def logger_db(log_type: str, message: str):
+    """Logging function to log statements flagged by the database instrumentation."""
+
+    FORMAT = "%(asctime)s - %(levelname)s - %(message)s"  # Required format
+
+    logger = logging.getLogger("dbserver")
+
+    if not logger.handlers:  # Writing to its own file instead of the root logger's
+        handler = logging.FileHandler(db_path)
+        handler.setFormatter(logging.Formatter(FORMAT))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
     if log_type == "i":  # INFO
         logger.info(msg=message)
 
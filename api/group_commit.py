@@ -0,0 +1,224 @@
+from fastapi import HTTPException, status
+from itertools import groupby
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import queue
+import threading
+import time
+import api.config as config
+import api.database as database
+import api.conditional as conditional
+import api.functions as fun
+
+### Group commit of single-row inserts, coalescing concurrent requests into one transaction
+
+enabled = config.get_group_commit()
+window = config.get_group_commit_window_ms() / 1000
+max_rows = config.get_group_commit_max_rows()
+timeout = config.get_group_commit_timeout()
+
+# Inserts waiting for the writer thread
+insert_queue = queue.Queue()
+writer = None
+writer_lock = threading.Lock()
+
+
+class PendingInsert:
+    """An insert handed to the writer thread, and the request thread waiting for its row"""
+
+    __slots__ = (
+        "model",
+        "values",
+        "on_insert",
+        "done",
+        "row",
+        "error",
+        "lock",
+        "taken",
+    )
+
+    def __init__(self, model, values: dict, on_insert=None):
+        self.model = model
+        self.values = values
+        self.on_insert = (
+            on_insert  # Called with the session and the row before the group commits
+        )
+        self.done = threading.Event()
+        self.row = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.taken = (
+            None  # Whether the writer took the insert, or the request withdrew it
+        )
+
+    def take(self, taken: bool) -> bool:
+        """Settles who owns the insert, returning whether this call did"""
+
+        with self.lock:
+            if self.taken is None:
+                self.taken = taken
+                return True
+
+            return False
+
+
+def active(db: Session) -> bool:
+    """Whether the inserts of the session go through the group commit, which a batch with its own transaction bypasses"""
+
+    return enabled and not db.info.get("batch")
+
+
+def insert_row(model, values: dict, on_insert=None) -> dict:
+    """Inserts the row in the next group and returns it as stored, once the group has committed,
+    calling on_insert with the session and the row within the transaction of the group
+    """
+
+    start_writer()
+    writes = database.current_writes.get()
+    pending = PendingInsert(model, values, on_insert)
+    insert_queue.put(pending)
+
+    if not pending.done.wait(timeout):
+        if pending.take(False):  # Still queued, the writer skips it
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The insert timed out before it was written, please retry",
+            )
+
+        if not pending.done.wait(timeout):  # Taken into a group still committing
+            if writes is not None:
+                writes.in_flight = True  # Keeping the idempotency key from a retry
+
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="The insert is still being committed, check for it before retrying",
+            )
+
+    if pending.error is not None:
+        raise pending.error
+
+    if writes is not None:  # Committed by the writer thread, outside the request
+        writes.committed = True
+
+    return pending.row
+
+
+def commit(group: list):
+    """Inserts the whole group in one transaction, one multi-row statement per table"""
+
+    with database.SessionLocal() as db:
+        for model, inserts in groupby(
+            sorted(group, key=lambda pending: pending.model.__tablename__),
+            key=lambda pending: pending.model,
+        ):
+            inserts = list(inserts)
+            rows = db.execute(
+                insert(model.__table__).returning(
+                    *model.__table__.columns, sort_by_parameter_order=True
+                ),
+                [pending.values for pending in inserts],
+            )  # Rows come back in the order of the parameters
+
+            for pending, row in zip(inserts, rows):
+                pending.row = row._asdict()
+
+                if pending.on_insert is not None:
+                    pending.on_insert(db, pending.row)
+
+        for account_id in {
+            pending.values["account_id"] for pending in group
+        }:  # Written just before committing, in the same order by every transaction
+            conditional.bump_version(db, account_id)
+
+        db.commit()
+
+
+def collect() -> list:
+    """Returns the inserts arriving within the window of the first one, up to the row limit, skipping withdrawn ones"""
+
+    group = []
+    deadline = None
+
+    while len(group) < max_rows:
+        if deadline is None:
+            pending = insert_queue.get()
+            deadline = time.monotonic() + window
+
+        else:
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                pending = insert_queue.get(timeout=remaining)
+
+            except queue.Empty:
+                break
+
+        if pending.take(True):
+            group.append(pending)
+
+    return group
+
+
+def write_group(group: list):
+    """Commits the group, setting the row or the error of every insert"""
+
+    try:
+        commit(group)
+
+    except Exception as error:
+        if len(group) == 1:
+            group[0].error = error
+
+        else:  # Retrying one by one, so a bad row only fails its own request
+            for pending in group:
+                try:
+                    commit([pending])
+
+                except Exception as row_error:
+                    pending.error = row_error
+
+
+def write_groups():
+    """Collects inserts for up to the window or the row limit, then commits them together"""
+
+    while True:
+        group = collect()
+
+        try:
+            write_group(group)
+
+        except (
+            BaseException
+        ) as error:  # Failing the waiting requests before the thread ends
+            for pending in group:
+                pending.error = error
+
+            fun.logger_db(log_type="e", message=f"Group Commit -> {error!r}")
+            raise
+
+        finally:
+            for pending in group:
+                pending.done.set()
+
+
+def start_writer():
+    """Starts the writer thread, again if it has died"""
+
+    global writer
+
+    if writer is not None and writer.is_alive():
+        return
+
+    with writer_lock:
+        if writer is None or not writer.is_alive():
+            writer = threading.Thread(
+                target=write_groups, name="group-commit", daemon=True
+            )
+            writer.start()
+
+
+if enabled:
+    start_writer()
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from jose import jwt
+import api.migrations as migrations
+import api.database as database
+import api.oauth2 as oauth2
+import api.utils as utils
+import api.config as config
+import api.functions as fun
+
+### Liveness and readiness probes, and the warm-up run before a worker takes traffic
+
+router = APIRouter(tags=["Health"], prefix="/health")
+
+warm = False  # Set once the warm-up has finished
+
+
+def warm_up():
+    """Checks the schema is up to date and pays the cold-start costs before the first request does"""
+
+    global warm
+
+    migrations.check(
+        database.engine
+    )  # Upgraded beforehand by python -m api.migrations, outside the worker timeout
+
+    connections = [
+        database.engine.connect() for _ in range(config.get_db_pool_size())
+    ]  # Opening the whole pool at once, so it is full when checked back in
+
+    for connection in connections:
+        connection.close()
+
+    token = oauth2.create_access_token(
+        {"user_id": "warm-up", "account_id": "warm-up", "phone": "0"}
+    )
+    jwt.decode(
+        token, oauth2.jwt_secret, algorithms=[oauth2.jwt_algo]
+    )  # Priming the JWT signing and verifying code paths
+
+    utils.verify("warm-up", utils.hash("warm-up"))  # Loading the bcrypt backend
+
+    warm = True
+
+
+def pool_headroom() -> int:
+    """Returns how many more connections the pool can hand out without waiting"""
+
+    capacity = config.get_db_pool_size() + config.get_db_max_overflow()
+
+    return capacity - database.engine.pool.checkedout()
+
+
+@router.get("/live", status_code=status.HTTP_200_OK)
+def live():
+    """Reports the process as alive, without touching the database"""
+
+    return {"status": "alive"}
+
+
+@router.get("/ready", status_code=status.HTTP_200_OK)
+def ready():
+    """Reports whether the worker is warm and the database is reachable with connections to spare"""
+
+    if not warm:
+        return JSONResponse(
+            {"status": "warming up"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    headroom = pool_headroom()
+
+    if (
+        headroom <= 0
+    ):  # Checking before connecting, so the probe never waits on a full pool
+        return JSONResponse(
+            {"status": "pool exhausted", "headroom": headroom},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    try:
+        with database.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    except SQLAlchemyError as error:
+        fun.logger_db(
+            log_type="e", message=f"Readiness -> Database unreachable: {error}"
+        )
+        return JSONResponse(
+            {"status": "database unreachable"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+    return {"status": "ready", "headroom": headroom}
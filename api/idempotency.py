@@ -0,0 +1,311 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, or_, select, update
+from jose import JWTError, jwt
+import asyncio
+import hashlib
+import json
+import time
+import api.config as config
+import api.database as database
+import api.models as models
+import api.oauth2 as oauth2
+
+### Idempotency-Key support for POST and PUT, replaying the stored response of a retried request
+
+ttl = config.get_idempotency_ttl()
+wait = config.get_idempotency_wait()
+stale_pending = 60  # Seconds until a pending entry counts as abandoned
+retry_after = 1  # Seconds a duplicate still running after the wait is told to wait
+first_poll = 0.05
+max_poll = 1.0  # Backing off to, as duplicates wait outside the limits
+purge_interval = 60
+
+last_purge = 0.0
+entries = models.IdempotencyKey
+running = {}  # Key -> event set once the request of this worker holding it finishes
+
+
+def scope_of(headers: dict) -> str:
+    """Returns whom the key belongs to, the user of a valid access token or else the credentials sent"""
+
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+
+    try:
+        payload = jwt.decode(
+            authorization.removeprefix("Bearer ").strip(),
+            oauth2.jwt_secret,
+            algorithms=[oauth2.jwt_algo],
+        )
+        return f"user:{payload['user_id']}"
+
+    except (JWTError, KeyError):
+        return f"credentials:{hashlib.sha256(authorization.encode()).hexdigest()}"
+
+
+def purge(now: float):
+    """Deletes expired entries, at most once per purge interval"""
+
+    global last_purge
+
+    if now - last_purge < purge_interval:
+        return
+
+    last_purge = now
+
+    with database.engine.begin() as connection:
+        connection.execute(delete(entries).where(entries.created_at < now - ttl))
+
+
+def claim(key: str, request_hash: str):
+    """Inserts a pending entry for the key, returning whether it was claimed and otherwise the existing entry"""
+
+    now = time.time()
+    purge(now)
+
+    with database.engine.begin() as connection:
+        connection.execute(
+            delete(entries).where(
+                entries.key == key,
+                or_(
+                    entries.created_at < now - ttl,
+                    and_(
+                        entries.status_code.is_(None),
+                        entries.created_at < now - stale_pending,
+                    ),
+                ),
+            )
+        )  # Expired or abandoned, the key is free again
+
+        claimed = connection.execute(
+            database.insert(entries)
+            .values(key=key, request_hash=request_hash, created_at=now)
+            .on_conflict_do_nothing()
+            .returning(entries.key)
+        ).first()
+
+        if claimed is not None:
+            return True, None
+
+        entry = connection.execute(
+            select(
+                entries.request_hash,
+                entries.status_code,
+                entries.headers,
+                entries.body,
+            ).where(entries.key == key)
+        ).first()
+
+        return False, entry
+
+
+def complete(key: str, status_code: int, headers: list, body: bytes):
+    """Stores the response, with its headers but the length the replay sets again"""
+
+    stored = [
+        [name.decode("latin-1"), value.decode("latin-1")]
+        for name, value in headers
+        if name.lower() != b"content-length"
+    ]
+
+    with database.engine.begin() as connection:
+        connection.execute(
+            update(entries)
+            .where(entries.key == key)
+            .values(status_code=status_code, headers=json.dumps(stored), body=body)
+        )
+
+
+def release(key: str):
+    """Frees the key after a failed request, so a retry runs it again"""
+
+    with database.engine.begin() as connection:
+        connection.execute(delete(entries).where(entries.key == key))
+
+
+def stored_headers(headers: str) -> list:
+    return [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in json.loads(headers or "[]")
+    ]
+
+
+def settle(key: str, writes, status_code: int, headers: list, body: bytes):
+    """Stores the response of a request that answered or wrote, freeing the key of one that failed before writing"""
+
+    if writes.in_flight and not writes.committed:
+        return  # Left pending until stale, long after the write has settled
+
+    if status_code is not None and status_code < 500:
+        complete(key, status_code, headers, body)
+
+    elif writes.committed:  # Failed after writing, a retry must not write again
+        complete(
+            key,
+            status_code or 500,
+            headers
+            if status_code
+            else [(b"content-type", b"text/plain; charset=utf-8")],
+            body if status_code else b"Internal Server Error",
+        )
+
+    else:
+        release(key)
+
+
+async def respond(send, status_code: int, body: bytes, *headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-length", str(len(body)).encode()), *headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware running a POST or PUT with an Idempotency-Key header at most once per key"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+
+        while more_body:  # Reading the whole body to fingerprint the request
+            message = await receive()
+
+            if message["type"] == "http.disconnect":
+                return
+
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        request_hash = hashlib.sha256(
+            b"\0".join(
+                [
+                    scope["method"].encode(),
+                    scope["path"].encode(),
+                    scope["query_string"],
+                    body,
+                ]
+            )
+        ).hexdigest()
+        key = hashlib.sha256(
+            f"{scope_of(headers)}:{idempotency_key.decode('latin-1')}".encode()
+        ).hexdigest()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        poll = first_poll
+
+        while True:
+            claimed, entry = await run_in_threadpool(claim, key, request_hash)
+
+            if claimed:
+                break
+
+            if entry is None:  # Freed in the meantime, claiming again
+                continue
+
+            if entry.request_hash != request_hash:
+                await respond(
+                    send,
+                    422,
+                    b'{"detail":"Idempotency-Key was already used for a different request"}',
+                    (b"content-type", b"application/json"),
+                )
+                return
+
+            if entry.status_code is not None:  # Replaying the stored response
+                await respond(
+                    send,
+                    entry.status_code,
+                    entry.body,
+                    *stored_headers(entry.headers),
+                    (b"idempotent-replayed", b"true"),
+                )
+                return
+
+            remaining = deadline - loop.time()
+
+            if remaining <= 0:
+                await respond(
+                    send,
+                    409,
+                    b'{"detail":"A request with this Idempotency-Key is still in progress"}',
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(retry_after).encode()),
+                )
+                return
+
+            finished = running.get(key, asyncio.Event())
+
+            try:  # Woken at once by a first request in this worker, polling for one in another
+                await asyncio.wait_for(finished.wait(), min(poll, remaining))
+
+            except asyncio.TimeoutError:
+                pass
+
+            poll = min(poll * 2, max_poll)
+
+        replayed = False
+
+        async def receive_body():
+            nonlocal replayed
+
+            if replayed:
+                return await receive()
+
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status_code = None
+        response_headers = []
+        chunks = []
+
+        async def send_captured(message):
+            nonlocal status_code, response_headers
+
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = list(message.get("headers", []))
+
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+            await send(message)
+
+        running[key] = asyncio.Event()
+        writes = database.Writes()
+        token = database.current_writes.set(writes)
+
+        try:
+            await self.app(scope, receive_body, send_captured)
+
+        except BaseException:
+            status_code = None
+            raise
+
+        finally:
+            database.current_writes.reset(token)
+
+            try:
+                await run_in_threadpool(
+                    settle, key, writes, status_code, response_headers, b"".join(chunks)
+                )
+
+            finally:
+                running.pop(key).set()
@@ -1,16 +1,24 @@
-from fastapi import status, HTTPException, APIRouter, Depends
-from sqlalchemy import func
+from fastapi import status, HTTPException, APIRouter, Depends, Request, Response
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
+from functools import partial
 from typing import List
 from datetime import date
 import api.models as models
 import api.schemas as schemas
 import api.oauth2 as oauth2
 import api.functions as fun
-from api.database import get_db
-from uuid import uuid4
+import api.profiler as profiler
+import api.serializers as serializers
+import api.conditional as conditional
+import api.cache as cache
+import api.group_commit as group_commit
+import api.events as events
+import api.names as names
+import api.filters as filters
+from api.database import get_db, write_row
 
-router = APIRouter(tags=["Income"], prefix="/api")
+router = APIRouter(tags=["Income"], prefix="/api", route_class=profiler.ProfilingRoute)
 
 
 @router.get(
@@ -19,34 +27,58 @@ router = APIRouter(tags=["Income"], prefix="/api")
     status_code=status.HTTP_200_OK,
 )
 def get_income(
-    db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)
+    request: Request,
+    fields: tuple = Depends(serializers.fieldset(schemas.IncomeOut)),
+    listing: filters.Listing = Depends(filters.listing(filters.income)),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
 ):
     """Get all incomes."""
 
-    if fun.verify_user_role(
-        current_user.role, "user"
-    ):  # Getting the incomes pertaining to the user
-        incomes = (
-            db.query(models.Income)
-            .filter(
-                func.date(models.Income.timestamp) == date.today(),
-                models.Income.user_id == current_user.user_id,
-                models.Income.account_id == current_user.account_id,
-            )
-            .all()
+    version = conditional.version(db, current_user.account_id)
+    etag = conditional.etag(
+        version, current_user, "income", date.today(), fields, listing.key
+    )
+
+    if conditional.not_modified(
+        request, etag
+    ):  # Client already has the current incomes, skipping the query
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
         )
 
-    if fun.verify_user_role(
-        current_user.role, "account_admin"
-    ):  # Getting the incomes pertaining to the account admin
-        incomes = (
-            db.query(models.Income)
-            .filter(
-                func.date(models.Income.timestamp) == date.today(),
-                models.Income.account_id == current_user.account_id,
+    key = cache.key("income", current_user, version, date.today(), fields, listing.key)
+    incomes = cache.get(key)
+
+    if incomes is None:  # Reading through to the database on a cache miss
+        if fun.verify_user_role(
+            current_user.role, "user"
+        ):  # Getting the incomes pertaining to the user
+            incomes = serializers.fetch(
+                db.query(*serializers.columns(models.Income, schemas.IncomeOut, fields))
+                .filter(
+                    func.date(models.Income.timestamp) == date.today(),
+                    models.Income.user_id == current_user.user_id,
+                    models.Income.account_id == current_user.account_id,
+                    *listing.criteria,
+                )
+                .order_by(*listing.order)
+            )
+
+        if fun.verify_user_role(
+            current_user.role, "account_admin"
+        ):  # Getting the incomes pertaining to the account admin
+            incomes = serializers.fetch(
+                db.query(*serializers.columns(models.Income, schemas.IncomeOut, fields))
+                .filter(
+                    func.date(models.Income.timestamp) == date.today(),
+                    models.Income.account_id == current_user.account_id,
+                    *listing.criteria,
+                )
+                .order_by(*listing.order)
             )
-            .all()
-        )
+
+        cache.put(key, incomes)
 
     if not incomes:  # If no income is found for this user or account administrator
         fun.logger(
@@ -67,7 +99,7 @@ def get_income(
         message="Get Income -> Requested Incomes Returned",
     )
 
-    return incomes
+    return serializers.respond(incomes, headers={"ETag": etag})
 
 
 @router.post(
@@ -79,17 +111,29 @@ def add_income(
     current_user: int = Depends(oauth2.get_current_user),
 ):
     """Add income to the database"""
-    new_income = models.Income(
+    income_dict = dict(
         account_id=current_user.account_id,
-        account_name=current_user.account_name,
-        trans_id=uuid4(),
+        trans_id=fun.generate_id(),
         user_id=current_user.user_id,
-        user_name=current_user.user_name,
-        **income.dict(),
+        amount=income.amount,
+        method_id=names.method_id(db, income.method),
     )
-    db.add(new_income)
-    db.commit()
-    db.refresh(new_income)  # Adding the new income model to the database
+
+    if group_commit.active(db):  # Committed together with concurrent inserts
+        db.commit()  # A new payment method goes first
+        new_income = group_commit.insert_row(
+            models.Income,
+            income_dict,
+            partial(events.publish_row, "income.created", schemas.IncomeOut),
+        )  # Published within the transaction of the group
+
+    else:
+        new_income = write_row(
+            db, insert(models.Income.__table__).values(**income_dict)
+        )  # Adding the new income to the database, returning it as stored
+        events.publish_row("income.created", schemas.IncomeOut, db, new_income)
+        conditional.bump_version(db, current_user.account_id)
+        db.commit()
 
     fun.logger(
         account_id=str(current_user.account_id),
@@ -112,62 +156,60 @@ def update_income(
 ):
     """Update a wrongly entered income in the database using the transaction id as id and amount"""
 
-    income_query = db.query(models.Income).filter(
-        models.Income.trans_id == income_update.trans_id
-    )
-    income = (
-        income_query.first()
-    )  # Getting the income query corresponding to the transaction id
-
-    if income is None:  # If no income is found
-        fun.logger(
-            account_id=str(current_user.account_id),
-            user_id=str(current_user.user_id),
-            log_type="w",
-            message="Update Income -> Requested Income does not exist",
+    updated_income = write_row(
+        db,
+        update(models.Income.__table__)
+        .where(
+            models.Income.trans_id == income_update.trans_id,
+            *fun.scope(models.Income, current_user),
         )
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Income with id: {income_update.trans_id} does not exist",
+        .values(amount=income_update.amount),
+    )  # Updating the income only if it is within the scope of the current user
+
+    if updated_income is None:  # Telling a missing income from one of someone else
+        income = (
+            db.query(models.Income.trans_id)
+            .filter(models.Income.trans_id == income_update.trans_id)
+            .first()
         )
-    if fun.verify_user_role(
-        current_user.role, "user"
-    ):  # Refraining user from altering other users' incomes
-        if (
-            income.user_id != current_user.user_id
-            or income.account_id != current_user.account_id
-        ):
+
+        if income is None:  # If no income is found
             fun.logger(
                 account_id=str(current_user.account_id),
                 user_id=str(current_user.user_id),
-                log_type="c",
-                message="Update Income -> User does not have privileges to update others' incomes",
+                log_type="w",
+                message="Update Income -> Requested Income does not exist",
             )
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform the requested action",
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Income with id: {income_update.trans_id} does not exist",
             )
 
-    if fun.verify_user_role(
-        current_user.role, "account_admin"
-    ):  # Refraining account administrator from altering other accounts' incomes
-        if income.account_id != current_user.account_id:
+        if fun.verify_user_role(
+            current_user.role, "user"
+        ):  # Refraining user from altering other users' incomes
             fun.logger(
                 account_id=str(current_user.account_id),
                 user_id=str(current_user.user_id),
                 log_type="c",
-                message="Update Income -> Account Administrator trying to change the entries of other account",
+                message="Update Income -> User does not have privileges to update others' incomes",
             )
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Not authorized to perform the requested action",
+
+        else:  # Refraining account administrator from altering other accounts' incomes
+            fun.logger(
+                account_id=str(current_user.account_id),
+                user_id=str(current_user.user_id),
+                log_type="c",
+                message="Update Income -> Account Administrator trying to change the entries of other account",
             )
 
-    income_update_dict = {
-        "amount": income_update.amount,
-    }
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to perform the requested action",
+        )
 
-    income_query.update(income_update_dict, synchronize_session=False)
+    events.publish_row("income.updated", schemas.IncomeOut, db, updated_income)
+    conditional.bump_version(db, current_user.account_id)
     db.commit()  # Updating the incomes table
 
     fun.logger(
@@ -176,4 +218,4 @@ def update_income(
         log_type="i",
         message="Update Income -> Requested Income Updated",
     )
-    return income_query.first()
+    return updated_income
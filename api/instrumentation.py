@@ -0,0 +1,101 @@
+from collections import Counter
+from contextvars import ContextVar
+import time
+from sqlalchemy import event
+import api.config as config
+import api.functions as fun
+import api.tracing as tracing
+
+### Per-request SQL instrumentation hooked onto the engine's cursor events
+
+debug = config.get_debug()
+slow_query_ms = config.get_slow_query_ms()
+repeated_query_threshold = config.get_repeated_query_threshold()
+
+
+class QueryStats:
+    """Statements issued and time spent in the database while serving a single request"""
+
+    def __init__(self, route: str):
+        self.route = route
+        self.count = 0
+        self.duration = 0.0  # Seconds
+        self.statements = Counter()  # Statement -> times issued in this request
+
+
+current_stats: ContextVar = ContextVar("current_stats", default=None)
+
+
+def attach(engine):
+    """Registers the statement counting hooks on the given engine"""
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    tracing.record("db.statement", elapsed, statement=statement)
+
+    stats = current_stats.get()
+
+    if (
+        stats is None
+    ):  # Statement issued outside of a request, eg. create_all at startup
+        return
+
+    stats.count += 1
+    stats.duration += elapsed
+    stats.statements[statement] += 1
+
+    if elapsed * 1000 >= slow_query_ms:
+        fun.logger_db(
+            log_type="w",
+            message=f"Slow Query -> {stats.route} took {elapsed * 1000:.1f} ms: {statement}",
+        )
+
+
+def report(stats: QueryStats):
+    """Logs the statements that were repeated often enough within the request to be an N+1 pattern"""
+
+    for statement, count in stats.statements.items():
+        if count >= repeated_query_threshold:
+            fun.logger_db(
+                log_type="w",
+                message=f"Repeated Query -> {stats.route} ran {count} times, likely N+1: {statement}",
+            )
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware tracking the SQL of each request and exposing it as headers in debug mode"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(f"{scope['method']} {scope['path']}")
+        token = current_stats.set(stats)
+
+        async def send_with_headers(message):
+            if debug and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode()))
+                headers.append((b"x-db-time", f"{stats.duration * 1000:.3f}".encode()))
+                message["headers"] = headers
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+
+        finally:
+            current_stats.reset(token)
+            report(stats)
@@ -0,0 +1,169 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.sql.functions import FunctionElement
+import api.database as database
+import api.models as models
+
+### Schema upgrades for databases created by older versions, which create_all leaves untouched
+### Run once before the server starts, with python -m api.migrations
+
+migration_lock = (
+    4242  # Advisory lock id, so upgrades started together run one at a time
+)
+derived = {  # Column replacing an obsolete one -> expression filling it from the old row
+    "method_id": "(SELECT method_id FROM paymentmethods WHERE paymentmethods.method = old.method)",
+    "updated_at": "old.timestamp",
+}
+epoch = "'1970-01-01 00:00:00'"  # Constant default sqlite adds instead of now(), overwritten by the backfill
+
+
+def add_column(connection, table, column):
+    """Adds the missing column, with its server default so existing rows satisfy NOT NULL"""
+
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}"
+
+    default = connection.dialect.ddl_compiler(
+        connection.dialect, None
+    ).get_column_default_string(column)
+
+    if connection.dialect.name == "sqlite" and isinstance(
+        getattr(column.server_default, "arg", None), FunctionElement
+    ):  # Only constant defaults can be added, the model sets the time of new rows
+        ddl += f" DEFAULT {epoch}"
+
+    elif default is not None:
+        ddl += f" DEFAULT {default}"
+
+    if not column.nullable:
+        ddl += " NOT NULL"
+
+    connection.execute(text(ddl))
+
+    if column.name == "updated_at" and "timestamp" in table.columns:
+        connection.execute(
+            text(f"UPDATE {table.name} SET updated_at = timestamp")
+        )  # Backfilling with the creation time
+
+
+def rebuild(connection, table, columns: set):
+    """Copies the rows into a table of the current definition replacing the old one, which had the given columns"""
+
+    old = f"{table.name}_old"
+    inspector = inspect(connection)
+    indexes = [index["name"] for index in inspector.get_indexes(table.name)]
+    constraints = [inspector.get_pk_constraint(table.name).get("name")] + [
+        foreign_key["name"] for foreign_key in inspector.get_foreign_keys(table.name)
+    ]
+
+    connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+
+    for index in indexes:  # Freeing the names for the new table
+        connection.execute(text(f"DROP INDEX {index}"))
+
+    for constraint in constraints:
+        if constraint is not None:  # Named constraint, eg. on postgres
+            connection.execute(text(f"ALTER TABLE {old} DROP CONSTRAINT {constraint}"))
+
+    if "method" in columns:  # Filling the dictionary the new rows reference
+        connection.execute(
+            text(
+                f"INSERT INTO paymentmethods (method) SELECT DISTINCT method FROM {old}"
+                " WHERE method NOT IN (SELECT method FROM paymentmethods)"
+            )
+        )
+
+    table.create(connection)
+    copied = [
+        column.name
+        for column in table.columns
+        if column.name in columns or column.name in derived
+    ]
+    values = [f"old.{name}" if name in columns else derived[name] for name in copied]
+
+    connection.execute(
+        text(
+            f"INSERT INTO {table.name} ({', '.join(copied)})"
+            f" SELECT {', '.join(values)} FROM {old} AS old"
+        )
+    )
+    connection.execute(text(f"DROP TABLE {old}"))
+    connection.execute(text(f"ANALYZE {table.name}"))
+
+
+def upgrade(engine):
+    """Creates missing tables, then adds the columns and indexes the existing ones lack, rebuilding the tables with obsolete columns"""
+
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": migration_lock}
+            )
+
+        models.Base.metadata.create_all(bind=connection)
+        inspector = inspect(connection)
+
+        for table in models.Base.metadata.sorted_tables:
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+
+            if columns - set(table.columns.keys()):  # eg. names now referenced by id
+                rebuild(connection, table, columns)
+                continue
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+
+            for column in table.columns:
+                if column.name not in columns:
+                    add_column(connection, table, column)
+
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+
+
+def missing(engine) -> list:
+    """Returns the tables, sequences, columns and indexes the schema lacks or has left over"""
+
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        tables = set(inspector.get_table_names())
+        found = [
+            sequence.name
+            for sequence in [models.event_ids]
+            if connection.dialect.supports_sequences
+            and not inspector.has_sequence(sequence.name)
+        ]
+
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in tables:
+                found.append(table.name)
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            found += [
+                f"{table.name}.{name}"
+                for name in sorted(columns ^ set(table.columns.keys()))
+            ]
+            found += [
+                index.name for index in table.indexes if index.name not in indexes
+            ]
+
+        return found
+
+
+def check(engine):
+    """Refuses to serve a schema the upgrade has not brought up to date"""
+
+    outdated = missing(engine)
+
+    if outdated:
+        raise RuntimeError(
+            f"The schema is out of date ({', '.join(outdated)}), run python -m api.migrations first"
+        )
+
+
+def main():
+    upgrade(database.engine)
+
+
+if __name__ == "__main__":
+    main()
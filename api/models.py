@@ -3,29 +3,64 @@ from sqlalchemy import (
     String,
     Boolean,
     ForeignKey,
-    UUID,
+    Uuid,
     Float,
     BigInteger,
+    Integer,
+    LargeBinary,
+    Index,
+    Sequence,
+    func,
 )
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.sql.expression import text
+from datetime import timezone
 from api.database import Base
 
 ### Models for defining the columns of respective tables and obtaining data in database
 
 
+class Timestamp(TypeDecorator):
+    """Timezone aware timestamp, kept in UTC on databases without time zones"""
+
+    impl = TIMESTAMP(timezone=True)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(
+                sqlite.DATETIME(
+                    storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+                )
+            )  # Whole seconds as CURRENT_TIMESTAMP writes them, so bound times compare with stored ones as text
+
+        return dialect.type_descriptor(self.impl)
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None and dialect.name == "sqlite":
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+
+        return value
+
+
 class Account(Base):
     """Accounts model for accounts table in database"""
 
     __tablename__ = "accounts"
 
     ## Specifying columns and datatypes
-    account_id = Column(UUID, primary_key=True, nullable=False)
+    account_id = Column(Uuid, primary_key=True, nullable=False)
     account_name = Column(String, nullable=False, unique=True)
     status = Column(Boolean, nullable=False, server_default=text("True"))
-    timestamp = timestamp = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
-    )
+    timestamp = timestamp = Column(Timestamp, nullable=False, server_default=func.now())
 
 
 class User(Base):
@@ -34,19 +69,36 @@ class User(Base):
     __tablename__ = "users"
 
     ## Specifying column titles and datatypes
-    account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
+    account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
     account_name = Column(String, ForeignKey("accounts.account_name"), nullable=False)
-    user_id = Column(UUID, primary_key=True, nullable=False)
+    user_id = Column(Uuid, primary_key=True, nullable=False)
     user_name = Column(String, nullable=False, unique=True)
     email = Column(String, nullable=False)
     phone = Column(String, nullable=False)
     acne = Column(String, nullable=False, unique=True)
     password = Column(String, nullable=False)
     role = Column(String, nullable=True)
-    timestamp = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
+    timestamp = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(
+        Timestamp,
+        nullable=False,
+        default=func.now(),  # Also set on insert, a column added by an upgrade of sqlite defaults to the epoch
+        server_default=func.now(),
+        onupdate=func.now(),
     )
 
+    __table_args__ = (Index("ix_users_account_updated", "account_id", "updated_at"),)
+
+
+class PaymentMethod(Base):
+    """Payment Method model for paymentmethods table in database"""
+
+    __tablename__ = "paymentmethods"
+
+    ## Specifying column titles and datatypes
+    method_id = Column(Integer, primary_key=True, nullable=False)
+    method = Column(String, nullable=False, unique=True)
+
 
 class Income(Base):
     """Income model for income table in database"""
@@ -54,16 +106,29 @@ class Income(Base):
     __tablename__ = "income"
 
     ## Specifying column titles and datatypes
-    account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
-    account_name = Column(String, ForeignKey("accounts.account_name"), nullable=False)
-    user_id = Column(UUID, ForeignKey("users.user_id"), nullable=False)
-    user_name = Column(String, ForeignKey("users.user_name"), nullable=False)
-    trans_id = Column(UUID, primary_key=True, nullable=False)
+    account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.user_id"), nullable=False)
+    trans_id = Column(Uuid, primary_key=True, nullable=False)
     amount = Column(BigInteger, nullable=False)
-    method = Column(String, nullable=False)
+    method_id = Column(
+        Integer, ForeignKey("paymentmethods.method_id"), nullable=False
+    )  # Names of the methods are kept once, in paymentmethods
     status = Column(Boolean, nullable=False, server_default=text("True"))
-    timestamp = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+    timestamp = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(
+        Timestamp,
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    __table_args__ = (
+        Index("ix_income_account_updated", "account_id", "updated_at"),
+        Index(
+            "ix_income_account_amount", "account_id", "amount"
+        ),  # Sorts of the list endpoints
+        Index("ix_income_account_timestamp", "account_id", "timestamp"),
     )
 
 
@@ -73,16 +138,27 @@ class Expend(Base):
     __tablename__ = "expend"
 
     ## Specifying column titles and datatypes
-    account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
-    account_name = Column(String, ForeignKey("accounts.account_name"), nullable=False)
-    user_id = Column(UUID, ForeignKey("users.user_id"), nullable=False)
-    user_name = Column(String, ForeignKey("users.user_name"), nullable=False)
-    expend_id = Column(UUID, primary_key=True, nullable=False)
+    account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.user_id"), nullable=False)
+    expend_id = Column(Uuid, primary_key=True, nullable=False)
     amount = Column(BigInteger, nullable=False)
-    expense_type_id = Column(UUID, nullable=False)
+    expense_type_id = Column(Uuid, nullable=False)
     status = Column(Boolean, nullable=False, server_default=text("True"))
-    timestamp = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")
+    timestamp = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(
+        Timestamp,
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    __table_args__ = (
+        Index("ix_expend_account_updated", "account_id", "updated_at"),
+        Index(
+            "ix_expend_account_amount", "account_id", "amount"
+        ),  # Sorts of the list endpoints
+        Index("ix_expend_account_timestamp", "account_id", "timestamp"),
     )
 
 
@@ -92,30 +168,83 @@ class ExpenseType(Base):
     __tablename__ = "expense"
 
     ## Specifying column titles and datatypes
-    account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
-    account_name = Column(String, ForeignKey("accounts.account_name"), nullable=False)
-    user_id = Column(UUID, ForeignKey("users.user_id"), nullable=False)
-    user_name = Column(String, ForeignKey("users.user_name"), nullable=False)
-    expense_type_id = Column(UUID, primary_key=True, nullable=False)
+    account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.user_id"), nullable=False)
+    expense_type_id = Column(Uuid, primary_key=True, nullable=False)
     expense_type = Column(String, nullable=False)
-    timestamp = Column(
-        TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
+    timestamp = Column(Timestamp, nullable=False, server_default=func.now())
+    updated_at = Column(
+        Timestamp,
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    __table_args__ = (Index("ix_expense_account_updated", "account_id", "updated_at"),)
+
+
+class ChangeVersion(Base):
+    """Change Version model for changeversions table in database"""
+
+    __tablename__ = "changeversions"
+
+    ## Specifying column titles and datatypes
+    account_id = Column(Uuid, primary_key=True, nullable=False)
+    version = Column(BigInteger, nullable=False, server_default=text("0"))
+
+
+event_ids = Sequence(
+    "event_ids", metadata=Base.metadata
+)  # Ids of the feed events, shared by every worker
+
+
+class Tombstone(Base):
+    """Tombstone model for tombstones table in database"""
+
+    __tablename__ = "tombstones"
+
+    ## Specifying column titles and datatypes
+    table_name = Column(String, primary_key=True, nullable=False)
+    row_id = Column(Uuid, primary_key=True, nullable=False)
+    account_id = Column(Uuid, nullable=False)
+    user_id = Column(Uuid, nullable=False)  # Owner of the deleted row
+    deleted_at = Column(Timestamp, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_tombstones_account_deleted", "account_id", "deleted_at"),
     )
 
 
+class IdempotencyKey(Base):
+    """Idempotency Key model for idempotencykeys table in database"""
+
+    __tablename__ = "idempotencykeys"
+
+    ## Specifying column titles and datatypes
+    key = Column(String, primary_key=True, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)  # Null while the request is running
+    headers = Column(
+        String, nullable=True
+    )  # JSON list of the [name, value] pairs of the response
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(Float, nullable=False)
+
+
 # class Attachment(Base):
 #     """Attachment Type model for attachments table in database"""
 
 #     __tablename__ = "attachments"
 
 #     ## Specifying column titles and datatypes
-#     account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
-#     user_id = Column(UUID, ForeignKey("users.user_id"), nullable=False)
-#     expend_id = Column(UUID, ForeignKey("expend.expend_id"), nullable=False)
-#     attachment_id = Column(UUID, primary_key=True, nullable=False)
+#     account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
+#     user_id = Column(Uuid, ForeignKey("users.user_id"), nullable=False)
+#     expend_id = Column(Uuid, ForeignKey("expend.expend_id"), nullable=False)
+#     attachment_id = Column(Uuid, primary_key=True, nullable=False)
 #     attachment = Column(String, nullable=True)
 #     timestamp = Column(
-#         TIMESTAMP(timezone=True), nullable=False, server_default=text("NOW()")
+#         Timestamp, nullable=False, server_default=func.now()
 #     )
 
 
@@ -126,9 +255,9 @@ class RefreshToken(Base):
 
     ## Specifying column titles and datatypes
 
-    account_id = Column(UUID, ForeignKey("accounts.account_id"), nullable=False)
-    user_id = Column(UUID, ForeignKey("users.user_id"), nullable=False)
-    token_id = Column(UUID, primary_key=True, nullable=False)
+    account_id = Column(Uuid, ForeignKey("accounts.account_id"), nullable=False)
+    user_id = Column(Uuid, ForeignKey("users.user_id"), nullable=False)
+    token_id = Column(Uuid, primary_key=True, nullable=False)
     refreshtoken = Column(String, nullable=False)
     created_at = Column(Float, nullable=False)
     expiry = Column(Float, nullable=False)
@@ -0,0 +1,123 @@
+from functools import partial
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import math
+import api.cache as cache
+import api.config as config
+import api.database as database
+import api.models as models
+
+### Cached lookups of the account, user and payment method names the fact tables only reference by id
+
+max_entries = config.get_name_cache_size()
+chunk_size = 1000  # Ids per lookup query, within the bound parameter limit of sqlite
+
+
+class Dictionary:
+    """Id to name lookups of a table, loading the ids missing from the cache in one query"""
+
+    def __init__(self, id_column, name_column):
+        self.id_column = id_column
+        self.name_column = name_column
+        self.names = cache.LRUCache(
+            max_entries, math.inf
+        )  # Ids are never reused, so a cached name never goes stale
+
+    def load(self, connection, ids: list, found: dict):
+        """Adds the names of the ids to the cache and the found names"""
+
+        for start in range(0, len(ids), chunk_size):
+            for key, name in connection.execute(
+                select(self.id_column, self.name_column).where(
+                    self.id_column.in_(ids[start : start + chunk_size])
+                )
+            ):
+                self.names.set(key, name)
+                found[key] = name
+
+    def resolve(self, db: Session, ids) -> dict:
+        """Returns the names of the ids, leaving out the ids no row names"""
+
+        found = {}
+        missing = []
+
+        for key in set(ids) - {None}:
+            name = self.names.get(key)
+
+            if name is None:
+                missing.append(key)
+
+            else:
+                found[key] = name
+
+        self.load(db, missing, found)
+        missing = [key for key in missing if key not in found]
+
+        if missing:  # Added after the snapshot of the session, eg. by the group commit
+            with database.engine.connect() as connection:
+                self.load(connection, missing, found)
+
+        return found
+
+
+accounts = Dictionary(models.Account.account_id, models.Account.account_name)
+users = Dictionary(models.User.user_id, models.User.user_name)
+methods = Dictionary(models.PaymentMethod.method_id, models.PaymentMethod.method)
+method_ids = cache.LRUCache(max_entries, math.inf)  # Method -> id
+
+fields = {  # Name field of the response schemas -> id column holding it and its lookup
+    "account_name": ("account_id", accounts),
+    "user_name": ("user_id", users),
+    "method": ("method_id", methods),
+}
+
+
+def fill(db: Session, rows: list, names) -> list:
+    """Replaces the ids the rows hold under the name fields with the names"""
+
+    for name in names:
+        found = fields[name][1].resolve(db, {row[name] for row in rows})
+
+        for row in rows:
+            row[name] = found.get(row[name])  # None once the named row is gone
+
+    return rows
+
+
+def add_names(db: Session, row: dict) -> dict:
+    """Adds the names of the ids of a written row, as the response schemas return them"""
+
+    names = [name for name, (id_key, _) in fields.items() if id_key in row]
+
+    for name in names:
+        row[name] = row[fields[name][0]]
+
+    return fill(db, [row], names)[0]
+
+
+def method_id(db: Session, method: str) -> int:
+    """Returns the id of the payment method, adding it to the dictionary within the transaction of the session if it is new"""
+
+    found = method_ids.get(method)
+
+    if found is not None:
+        return found
+
+    query = select(models.PaymentMethod.method_id).where(
+        models.PaymentMethod.method == method
+    )
+    found = db.execute(query).scalar()
+
+    if found is None:  # Another transaction adding it at the same time wins
+        db.execute(
+            database.insert(models.PaymentMethod)
+            .values(method=method)
+            .on_conflict_do_nothing(index_elements=["method"])
+        )
+        found = db.execute(query).scalar_one()
+
+    database.on_commit(
+        db, partial(method_ids.set, method, found)
+    )  # Cached once it surely exists
+
+    return found
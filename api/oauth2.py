@@ -1,5 +1,6 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+import hmac
 import time
 import api.schemas as schemas
 import api.models as models
@@ -8,6 +9,7 @@ from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import api.config as config
+import api.tracing as tracing
 from uuid import UUID
 
 
@@ -37,58 +39,59 @@ def create_access_token(data: dict):
 def get_current_user(token: str = Depends(oauth2_scheme)):
     """Verify if the given access token is a valid and authorized one"""
 
-    try:
-        payload = jwt.decode(
-            token, jwt_secret, algorithms=[jwt_algo]
-        )  # Decrypting the payload
-
-        account_id: str = payload.get("account_id")
-        account_name: str = payload.get("account_name")
-        user_id: str = payload.get("user_id")
-        user_name: str = payload.get("user_name")
-        email: str = payload.get("email")
-        phone: str = payload.get("phone")
-        role: str = payload.get("role")
+    with tracing.span("auth.decode"):
+        try:
+            payload = jwt.decode(
+                token, jwt_secret, algorithms=[jwt_algo]
+            )  # Decrypting the payload
+
+            account_id: str = payload.get("account_id")
+            account_name: str = payload.get("account_name")
+            user_id: str = payload.get("user_id")
+            user_name: str = payload.get("user_name")
+            email: str = payload.get("email")
+            phone: str = payload.get("phone")
+            role: str = payload.get("role")
+
+            if user_id is None:  # No user is present
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+            token_data = schemas.TokenData(
+                account_id=UUID(account_id),
+                account_name=account_name,
+                user_id=UUID(user_id),
+                user_name=user_name,
+                email=email,
+                phone=int(phone),
+                role=role,
+                access_token=token,
+            )
 
-        if user_id is None:  # No user is present
+        except JWTError:  # Could not validate JWT token
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        token_data = schemas.TokenData(
-            account_id=UUID(account_id),
-            account_name=account_name,
-            user_id=UUID(user_id),
-            user_name=user_name,
-            email=email,
-            phone=int(phone),
-            role=role,
-            access_token=token,
-        )
-
-    except JWTError:  # Could not validate JWT token
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
     return token_data
 
 
 def check_signup_key(signup_token: str = Depends(oauth2_scheme)):
     """Check signup key for super admin user"""
-    try:
-        signup_key == signup_token  # Trying if the signup key is the same as the signup token
-        return True
-
-    except:
+    if not hmac.compare_digest(
+        signup_token.encode(), signup_key.encode()
+    ):  # Comparing in constant time, so the key cannot be guessed from timings
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid Signup Key"
         )
 
+    return True
+
 
 def verify_refresh_token(
     db: Session = Depends(database.get_db), refresh_token: str = Depends(oauth2_scheme)
@@ -0,0 +1,249 @@
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from fastapi.routing import APIRoute
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+import api.config as config
+
+### On-demand profiling producing folded stacks, readable by flamegraph.pl, inferno and speedscope
+
+sample_interval = 0.005  # Seconds between two stack samples
+max_results = 20  # Finished profiles kept for download
+single_worker = (
+    config.get_workers() or 1
+) == 1  # Profiles are armed and kept in the memory of one worker
+
+idle_frames = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("runners.py", "run"),  # Event loop of uvloop, which has no Python frame of its own
+}  # Leaf frames of threads waiting for work, left out of worker profiles
+
+
+def frame_name(code) -> str:
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+def fold(frame) -> str:
+    """Returns the stack ending at the frame as a single folded line, outermost call first"""
+
+    names = []
+
+    while frame is not None:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+
+def folded(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class StackSampler:
+    """Samples the stacks of one thread, or of every busy thread, from a background thread"""
+
+    def __init__(self, thread_id=None, interval: float = sample_interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="stack-sampler", daemon=True
+        )
+
+    def run(self):
+        own_id = threading.get_ident()
+
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                if self.thread_id is not None and thread_id != self.thread_id:
+                    continue
+
+                leaf = (
+                    os.path.basename(frame.f_code.co_filename),
+                    frame.f_code.co_name,
+                )
+
+                if self.thread_id is None and leaf in idle_frames:
+                    continue
+
+                self.counts[fold(frame)] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self) -> str:
+        self.stopped.set()
+        self.thread.join()
+        return folded(self.counts)
+
+
+class CallTracer:
+    """Deterministic profiler attributing the exact self time of every call, in microseconds, to its stack"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.stack = []
+        self.last = 0
+
+    def trace(self, frame, event, arg):
+        now = time.perf_counter_ns()
+
+        if self.stack:
+            self.counts[";".join(self.stack)] += (now - self.last) // 1000
+
+        if event == "call":
+            self.stack.append(frame_name(frame.f_code))
+
+        elif event == "c_call":
+            self.stack.append(f"{getattr(arg, '__qualname__', arg)} (builtin)")
+
+        elif self.stack:  # return, c_return or c_exception
+            self.stack.pop()
+
+        self.last = time.perf_counter_ns()
+
+    def start(self):
+        self.last = time.perf_counter_ns()
+        sys.setprofile(self.trace)
+
+    def stop(self) -> str:
+        sys.setprofile(None)
+        self.counts = Counter({stack: us for stack, us in self.counts.items() if us})
+        return folded(self.counts)
+
+
+class ProfileSession:
+    """A request profile armed by a super admin, filled in by the next request to its path"""
+
+    def __init__(self, path: str, mode: str):
+        self.profile_id = uuid.uuid4().hex
+        self.path = path
+        self.mode = mode
+
+    def profiler(self):
+        if self.mode == "deterministic":
+            return CallTracer()
+
+        return StackSampler(thread_id=threading.get_ident())
+
+
+armed = {}  # Path -> session waiting for its request
+results = OrderedDict()  # Profile id -> folded stacks of the finished profile
+lock = threading.Lock()
+
+current_session: ContextVar = ContextVar("current_session", default=None)
+
+
+def arm(path: str, mode: str) -> ProfileSession:
+    """Arms profiling of the next request to the path handled by this worker"""
+
+    session = ProfileSession(path, mode)
+
+    with lock:
+        armed[path] = session
+
+    return session
+
+
+def store(session: ProfileSession, profile: str):
+    with lock:
+        results[session.profile_id] = profile
+
+        while len(results) > max_results:
+            results.popitem(last=False)
+
+
+async def profile_worker(seconds: float) -> str:
+    """Samples every busy thread of this worker for the given number of seconds, waiting without holding a thread"""
+
+    sampler = StackSampler()
+    sampler.start()
+    await asyncio.sleep(seconds)  # The idle event loop is left out like waiting threads
+    return sampler.stop()
+
+
+def profiled(endpoint):
+    """Wraps the endpoint so that it runs under the profiler of the current session, if any"""
+
+    if getattr(endpoint, "profiled", False):  # Routes are copied by include_router
+        return endpoint
+
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            session = current_session.get()
+
+            if session is None:
+                return await endpoint(*args, **kwargs)
+
+            profiler = session.profiler()
+            profiler.start()
+
+            try:
+                return await endpoint(*args, **kwargs)
+
+            finally:
+                store(session, profiler.stop())
+
+        async_wrapper.profiled = True
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = current_session.get()
+
+        if session is None:
+            return endpoint(*args, **kwargs)
+
+        profiler = session.profiler()
+        profiler.start()
+
+        try:
+            return endpoint(*args, **kwargs)
+
+        finally:
+            store(session, profiler.stop())
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Route whose endpoint is profiled when a super admin has armed a profile for its path"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiling_handler(request):
+            if not armed:  # Nothing armed, the common case
+                return await handler(request)
+
+            with lock:
+                session = armed.pop(request.url.path, None)
+
+            token = current_session.set(session)
+
+            try:
+                return await handler(request)
+
+            finally:
+                current_session.reset(token)
+
+        return profiling_handler
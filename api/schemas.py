@@ -1,4 +1,5 @@
 from pydantic import BaseModel, EmailStr, PositiveInt, UUID4
+from typing import List
 from datetime import datetime
 
 ## 1) Tokens
@@ -274,3 +275,81 @@ class SuperAdminAccountOut(BaseModel):  # Response Model
 
     class Config:  # Necessary for returning
         orm_mode = True
+
+
+class SuperAdminTraceOut(BaseModel):  # Response Model
+    """Validation class for output attributes of collected request traces."""
+
+    trace_id: str
+    spans: List[dict]
+
+
+class SuperAdminProfileIn(BaseModel):  # Input Model
+    """Validation class for input attributes to profile the next request to an endpoint."""
+
+    path: str
+    mode: str
+
+
+class SuperAdminProfileOut(BaseModel):  # Response Model
+    """Validation class for output attributes of an armed request profile."""
+
+    profile_id: str
+    path: str
+    mode: str
+
+    class Config:  # Necessary for returning
+        orm_mode = True
+
+
+# 8) Sync
+
+
+class TombstoneOut(BaseModel):  # Response Model
+    """Validation class for output attributes of a deleted row."""
+
+    table_name: str
+    row_id: UUID4
+    deleted_at: datetime
+
+
+class SyncOut(BaseModel):  # Response Model
+    """Validation class for output attributes of the changes since a sync cursor."""
+
+    cursor: str
+    has_more: bool  # More changes wait past the cursor, fetched by syncing again at once
+    income: List[IncomeOut]
+    expenditure: List[ExpenditureOut]
+    expense_types: List[ExpenseTypeOut]
+    users: List[AccountUserOut]
+    deleted: List[TombstoneOut]
+
+
+# 9) Batch
+
+
+class BatchOperationIn(BaseModel):  # Input Model
+    """Validation class for input attributes of one operation of a batch, eg. income.add with the body of that route."""
+
+    op: str
+    body: dict
+
+
+class BatchIn(BaseModel):  # Input Model
+    """Validation class for input attributes of a batch of operations run in one transaction."""
+
+    operations: List[BatchOperationIn]
+
+
+class BatchResultOut(BaseModel):  # Response Model
+    """Validation class for output attributes of one operation of a batch."""
+
+    op: str
+    status_code: int
+    result: dict
+
+
+class BatchOut(BaseModel):  # Response Model
+    """Validation class for output attributes of a committed batch, in the order of its operations."""
+
+    results: List[BatchResultOut]
@@ -0,0 +1,168 @@
+from gunicorn.app.base import BaseApplication
+import math
+import os
+import sys
+import api.config as config
+
+### Production server running the app in several uvicorn workers under gunicorn, started with python -m api.server
+
+unlimited = 2**60  # cgroup v1 reports a huge number instead of no limit
+
+
+def read_cgroup(path: str):
+    """Returns the stripped contents of the cgroup file, or None if it does not exist"""
+
+    try:
+        with open(path) as cgroup_file:
+            return cgroup_file.read().strip()
+
+    except OSError:
+        return None
+
+
+def cpu_limit() -> float:
+    """Returns the number of CPUs the process may use, honouring the cgroup quota of a container"""
+
+    cpus = len(os.sched_getaffinity(0))
+    quota = read_cgroup("/sys/fs/cgroup/cpu.max")  # cgroup v2, eg. "200000 100000"
+
+    if quota is not None:
+        limit, period = quota.split()
+
+        if limit != "max":
+            return min(cpus, int(limit) / int(period))
+
+        return cpus
+
+    limit = read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    period = read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+    if limit is not None and period is not None and int(limit) > 0:
+        return min(cpus, int(limit) / int(period))
+
+    return cpus
+
+
+def memory_limit():
+    """Returns the memory limit of the container in bytes, or None if unlimited"""
+
+    limit = read_cgroup("/sys/fs/cgroup/memory.max") or read_cgroup(
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+
+    if limit is None or limit == "max" or int(limit) >= unlimited:
+        return None
+
+    return int(limit)
+
+
+def worker_count() -> int:
+    """Returns the configured worker count, or one worker per CPU as far as the memory limit allows"""
+
+    workers = config.get_workers()
+
+    if workers is not None:
+        return workers
+
+    workers = max(1, math.ceil(cpu_limit()))  # Async workers, one per core is enough
+    memory = memory_limit()
+
+    if memory is not None:
+        workers = min(
+            workers, memory // (config.get_worker_memory_mb() * 1024 * 1024)
+        )  # Leaving no worker to be killed for running out of memory
+
+    return max(1, workers)
+
+
+def check_shared_state(workers: int):
+    """Refuses to run several workers with features keeping their state in the memory of a single one"""
+
+    if workers == 1:
+        return
+
+    local = []
+
+    if config.get_events_backend() != "postgres":
+        local.append(
+            "the memory events backend, feeds would miss other workers' writes"
+        )
+
+    elif (config.get_database_url() or "").startswith("sqlite"):
+        local.append(
+            "the embedded SQLite database, which has no LISTEN/NOTIFY for the feeds"
+        )
+
+    if config.get_trace_exporter() == "memory":
+        local.append(
+            "the memory trace exporter, each call would see one worker's traces"
+        )
+
+    if local:
+        sys.exit(
+            f"Cannot run {workers} workers with {'; '.join(local)}. Set KALLABOX_WORKERS=1"
+        )
+
+
+def share_connections(workers: int):
+    """Splits the database connection budget between the workers, unless the pool is configured explicitly"""
+
+    budget = config.get_db_max_connections()
+    per_worker = budget // workers
+
+    if config.get_events_backend() == "postgres":
+        per_worker -= 1  # Held by the event listener, outside the pool
+
+    if per_worker < 1:
+        sys.exit(
+            f"KALLABOX_DB_MAX_CONNECTIONS={budget} leaves no connection to each of {workers} workers"
+        )
+
+    pool_size = max(1, per_worker // 2)
+
+    # Read by api.database when each worker imports the app
+    os.environ.setdefault("KALLABOX_DB_POOL_SIZE", str(pool_size))
+    os.environ.setdefault("KALLABOX_DB_MAX_OVERFLOW", str(per_worker - pool_size))
+
+
+class Server(BaseApplication):
+    """Gunicorn application loading main:app in each worker after the fork"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from main import app  # Imported per worker, so no connection crosses a fork
+
+        return app
+
+
+def main():
+    workers = worker_count()
+    os.environ["KALLABOX_WORKERS"] = str(
+        workers
+    )  # Read by the workers, telling process-local features they are not alone
+    check_shared_state(workers)
+    share_connections(workers)
+
+    Server(
+        {
+            "bind": config.get_bind(),
+            "workers": workers,
+            "worker_class": "uvicorn.workers.UvicornWorker",  # Picks uvloop and httptools when installed
+            "max_requests": config.get_max_requests(),
+            "max_requests_jitter": config.get_max_requests_jitter(),
+            "graceful_timeout": config.get_graceful_timeout(),  # Draining in-flight requests on SIGTERM
+            "keepalive": 5,
+            "accesslog": "-",
+        }
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi import APIRouter, Depends, status, HTTPException, Response, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 from typing import List
 import api.database as database
@@ -7,10 +9,17 @@ import api.models as models
 import api.utils as utils
 import api.oauth2 as oauth2
 import api.functions as fun
+import api.profiler as profiler
+import api.serializers as serializers
+import api.conditional as conditional
+import api.sync as sync
+import api.tracing as tracing
+import api.filters as filters
 from sqlalchemy.exc import IntegrityError
-from uuid import uuid4
 
-router = APIRouter(tags=["Super Admin"], prefix="/api")
+router = APIRouter(
+    tags=["Super Admin"], prefix="/api", route_class=profiler.ProfilingRoute
+)
 
 
 @router.put(
@@ -25,36 +34,31 @@ def update_user_role(
 ):
     """Update the user's role using account name and email"""
     signup_key  # checking the validity of signup key
-    account = (
-        db.query(models.Account)
-        .filter(models.Account.account_name == user_update.account_name)
-        .first()
-    )  # Searching for the account
-    user_query = db.query(models.User).filter(
-        models.User.account_id == account.account_id,
-        models.User.user_name == user_update.user_name,
-    )
-    user = user_query.first()  # Searching for the user
+    updated_user = database.write_row(
+        db,
+        update(models.User.__table__)
+        .where(
+            models.User.account_name == user_update.account_name,
+            models.User.user_name == user_update.user_name,
+        )
+        .values(role=user_update.role),
+    )  # Updating the user's role
 
-    if user is None:  # Raise an error if the user is not found
+    if updated_user is None:  # Raise an error if the user is not found
         fun.logger_sa(log_type="w", message="Update User Role -> User does not exist")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User does not exist",
         )
 
-    role_change = {"role": user_update.role}
-
-    user_query.update(
-        role_change, synchronize_session=False
-    )  # Updating the user's role
+    conditional.bump_version(db, updated_user["account_id"])
     db.commit()  # Commiting the changes
 
     fun.logger_sa(
         log_type="i", message="Update User Role -> Requested User Role updated"
     )
 
-    return user_query.first()  # Returning the updated user
+    return updated_user  # Returning the updated user
 
 
 @router.delete("/admin/account", status_code=status.HTTP_204_NO_CONTENT)
@@ -131,6 +135,13 @@ def purge_account(
     )  # Delete all the users from the users table
     db.commit()
 
+    db.query(models.ChangeVersion).filter(
+        models.ChangeVersion.account_id == account.account_id
+    ).delete(synchronize_session=False)
+    db.query(models.Tombstone).filter(
+        models.Tombstone.account_id == account.account_id
+    ).delete(synchronize_session=False)
+
     account_query.delete(synchronize_session=False)
     db.commit()  # Finally deleting the account itself
 
@@ -180,22 +191,25 @@ def delete_user(
     )
 
     if income_query.all() is not None:
+        sync.bury(db, income_query, models.Income, models.Income.trans_id)
         income_query.delete(synchronize_session=False)
-        db.commit()
 
     if expenditure_query.all() is not None:
+        sync.bury(db, expenditure_query, models.Expend, models.Expend.expend_id)
         expenditure_query.delete(synchronize_session=False)
-        db.commit()
 
     if expense_query.all() is not None:
+        sync.bury(
+            db, expense_query, models.ExpenseType, models.ExpenseType.expense_type_id
+        )
         expense_query.delete(synchronize_session=False)
-        db.commit()
 
     if token_query.all() is not None:
         token_query.delete(synchronize_session=False)
-        db.commit()
 
+    sync.bury(db, user_query, models.User, models.User.user_id)
     user_query.delete(synchronize_session=False)
+    conditional.bump_version(db, user.account_id)
     db.commit()  # Delete the user
 
     fun.logger_sa(log_type="i", message="Delete User -> Requested User deleted")
@@ -217,10 +231,7 @@ def create_account(
     fun.check_account_name(
         account_credentials.account_name
     )  # Check if the account name is lowercase alphanumeric characters with no spaces
-    account = models.Account(
-        account_id=uuid4(), account_name=account_credentials.account_name
-    )
-
+    account_id = fun.generate_id()
     acne_cat = account_credentials.account_name + "---" + account_credentials.email
 
     password = account_credentials.password
@@ -256,21 +267,12 @@ def create_account(
             status_code=status.HTTP_409_CONFLICT, detail="User Name already exists"
         )
 
-    account_admin = models.User(
-        account_id=account.account_id,
-        account_name=account_credentials.account_name,
-        user_id=uuid4(),
-        user_name=account_credentials.user_name,
-        email=account_credentials.email,
-        phone=account_credentials.phone,
-        password=hashed_password,
-        role="account_admin",
-        acne=acne_cat,
-    )
     try:  # Try creating an account
-        db.add(account)
-        db.commit()
-        db.refresh(account)
+        db.execute(
+            insert(models.Account.__table__).values(
+                account_id=account_id, account_name=account_credentials.account_name
+            )
+        )
 
     except (
         IntegrityError
@@ -283,18 +285,25 @@ def create_account(
             status_code=status.HTTP_409_CONFLICT, detail="Account already exists"
         )
 
-    user = (
-        db.query(models.User)
-        .filter(
-            models.User.account_id == account_admin.account_id,
-            models.User.user_id == account_admin.user_id,
-            models.User.email == account_admin.email,
-            models.User.user_name == account_admin.user_name,
+    try:  # Creating the account_admin in the same transaction as the account
+        account_admin = database.write_row(
+            db,
+            insert(models.User.__table__).values(
+                account_id=account_id,
+                account_name=account_credentials.account_name,
+                user_id=fun.generate_id(),
+                user_name=account_credentials.user_name,
+                email=account_credentials.email,
+                phone=account_credentials.phone,
+                password=hashed_password,
+                role="account_admin",
+                acne=acne_cat,
+            ),
         )
-        .all()
-    )
+        db.commit()
 
-    if len(user) != 0:
+    except IntegrityError:
+        db.rollback()
         fun.logger_sa(
             log_type="w", message="Create Account -> Requested User already exists"
         )
@@ -303,11 +312,6 @@ def create_account(
             detail="User with email or username in this account already exists",
         )
 
-    else:
-        db.add(account_admin)
-        db.commit()
-        db.refresh(account_admin)
-
     fun.logger_sa(log_type="i", message="Create Account -> Requested Account Created")
 
     return account_admin  # Returning the account_admin details (which also contains the account name and id)
@@ -322,18 +326,18 @@ def delete_account(
     """Soft Delete the account by marking the status of the account as False"""
     signup_key
 
-    account_query = db.query(models.Account).filter(
-        models.Account.account_name == user_cred.account_name
+    account = database.write_row(
+        db,
+        update(models.Account.__table__)
+        .where(models.Account.account_name == user_cred.account_name)
+        .values(status=False),
     )
-    account = account_query.first()  # Searching for the account
 
     if account is None:  # Raising an error if account is not found
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Account does not exist",
         )
-    account_status = {"status": False}
-    account_query.update(account_status, synchronize_session=False)
     db.commit()  # Changing the status of account to False and commiting the changes
 
     return Response(
@@ -347,13 +351,20 @@ def delete_account(
     response_model=List[schemas.IncomeOut],
 )
 def get_income(
-    db: Session = Depends(database.get_db), signup_key=Depends(oauth2.check_signup_key)
+    fields: tuple = Depends(serializers.fieldset(schemas.IncomeOut)),
+    listing: filters.Listing = Depends(filters.listing(filters.income, scope=())),
+    db: Session = Depends(database.get_db),
+    signup_key=Depends(oauth2.check_signup_key),
 ):
     """Gets incomes associated with all the accounts and users"""
 
     signup_key  # Checking signup key
 
-    incomes = db.query(models.Income).all()  # Getting all the incomes
+    incomes = serializers.fetch(
+        db.query(*serializers.columns(models.Income, schemas.IncomeOut, fields))
+        .filter(*listing.criteria)
+        .order_by(*listing.order)
+    )  # Getting all the incomes
 
     if not incomes:  # Raising an error if incomes is not found
         fun.logger_sa(
@@ -365,7 +376,7 @@ def get_income(
 
     fun.logger_sa(log_type="i", message="Get Income -> Requested Incomes returned")
 
-    return incomes  # Returning all the incomes
+    return serializers.respond(incomes)  # Returning all the incomes
 
 
 @router.get(
@@ -374,12 +385,19 @@ def get_income(
     response_model=List[schemas.ExpenditureOut],
 )
 def get_expenditure(
-    db: Session = Depends(database.get_db), signup_key=Depends(oauth2.check_signup_key)
+    fields: tuple = Depends(serializers.fieldset(schemas.ExpenditureOut)),
+    listing: filters.Listing = Depends(filters.listing(filters.expenditure, scope=())),
+    db: Session = Depends(database.get_db),
+    signup_key=Depends(oauth2.check_signup_key),
 ):
     """Gets expenditures associated with all the accounts and users"""
     signup_key  # Checking signup key
 
-    expenditures = db.query(models.Expend).all()  # Getting all the expenditures
+    expenditures = serializers.fetch(
+        db.query(*serializers.columns(models.Expend, schemas.ExpenditureOut, fields))
+        .filter(*listing.criteria)
+        .order_by(*listing.order)
+    )  # Getting all the expenditures
 
     if not expenditures:  # Raising an error if expenditures is not found
         fun.logger_sa(
@@ -394,7 +412,7 @@ def get_expenditure(
         log_type="i", message="Get Expenditures -> Requested Expenditures returned"
     )
 
-    return expenditures  # Returning all the expenditures
+    return serializers.respond(expenditures)  # Returning all the expenditures
 
 
 @router.get(
@@ -403,12 +421,21 @@ def get_expenditure(
     response_model=List[schemas.ExpenseTypeOut],
 )
 def get_expense_type(
-    db: Session = Depends(database.get_db), signup_key=Depends(oauth2.check_signup_key)
+    fields: tuple = Depends(serializers.fieldset(schemas.ExpenseTypeOut)),
+    listing: filters.Listing = Depends(filters.listing(filters.expense_type, scope=())),
+    db: Session = Depends(database.get_db),
+    signup_key=Depends(oauth2.check_signup_key),
 ):
     """Gets expense types associated with all the accounts and users"""
     signup_key  # Checking signup key
 
-    expense_types = db.query(models.ExpenseType).all()  # Getting all the expense types
+    expense_types = serializers.fetch(
+        db.query(
+            *serializers.columns(models.ExpenseType, schemas.ExpenseTypeOut, fields)
+        )
+        .filter(*listing.criteria)
+        .order_by(*listing.order)
+    )  # Getting all the expense types
 
     if not expense_types:  # Raising an error if expense types is not found
         fun.logger_sa(
@@ -423,7 +450,7 @@ def get_expense_type(
         log_type="i", message="Get Expense Types -> Requested Expense Types returned"
     )
 
-    return expense_types  # Returning all the expense types
+    return serializers.respond(expense_types)  # Returning all the expense types
 
 
 @router.get(
@@ -432,12 +459,16 @@ def get_expense_type(
     response_model=List[schemas.SuperAdminUserOut],
 )
 def get_users(
-    db: Session = Depends(database.get_db), signup_key=Depends(oauth2.check_signup_key)
+    fields: tuple = Depends(serializers.fieldset(schemas.SuperAdminUserOut)),
+    db: Session = Depends(database.get_db),
+    signup_key=Depends(oauth2.check_signup_key),
 ):
     """ "Gets users from all accounts"""
     signup_key  # Checking signup key
 
-    users = db.query(models.User).all()  # Getting all the users
+    users = serializers.fetch(
+        db.query(*serializers.columns(models.User, schemas.SuperAdminUserOut, fields))
+    )  # Getting all the users
 
     if not users:  # Raising an error if users is not found
         fun.logger_sa(
@@ -449,7 +480,7 @@ def get_users(
 
     fun.logger_sa(log_type="i", message="Get Users -> Requested users returned")
 
-    return users  # Returning all the users
+    return serializers.respond(users)  # Returning all the users
 
 
 @router.get(
@@ -458,12 +489,18 @@ def get_users(
     response_model=List[schemas.SuperAdminAccountOut],
 )
 def get_accounts(
-    db: Session = Depends(database.get_db), signup_key=Depends(oauth2.check_signup_key)
+    fields: tuple = Depends(serializers.fieldset(schemas.SuperAdminAccountOut)),
+    db: Session = Depends(database.get_db),
+    signup_key=Depends(oauth2.check_signup_key),
 ):
     """Gets all accounts"""
     signup_key  # Checking signup key
 
-    accounts = db.query(models.Account).all()  # Getting all the accounts
+    accounts = serializers.fetch(
+        db.query(
+            *serializers.columns(models.Account, schemas.SuperAdminAccountOut, fields)
+        )
+    )  # Getting all the accounts
 
     if not accounts:  # Raising an error if accounts is not found
         fun.logger_sa(
@@ -475,4 +512,106 @@ def get_accounts(
 
     fun.logger_sa(log_type="i", message="Get Accounts -> Requested accounts returned")
 
-    return accounts  # Returning all the accounts
+    return serializers.respond(accounts)  # Returning all the accounts
+
+
+@router.get(
+    "/admin/traces",
+    status_code=status.HTTP_200_OK,
+    response_model=List[schemas.SuperAdminTraceOut],
+)
+def get_traces(signup_key=Depends(oauth2.check_signup_key)):
+    """Gets the request traces held by the in-process collector of this worker"""
+    signup_key  # Checking signup key
+
+    if tracing.exporter != "memory":  # Traces are written to the trace file instead
+        fun.logger_sa(
+            log_type="w", message="Get Traces -> In-process trace collector not enabled"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="In-process trace collector is not enabled",
+        )
+
+    fun.logger_sa(log_type="i", message="Get Traces -> Collected traces returned")
+
+    return list(tracing.collector)  # Returning the collected traces, oldest first
+
+
+def check_single_worker():
+    """Profiles live in the memory of the worker armed, so a later request could reach another worker"""
+
+    if not profiler.single_worker:  # Raising an error if several workers are running
+        fun.logger_sa(log_type="w", message="Profile -> Several workers running")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Profiling needs a single worker, start the server with KALLABOX_WORKERS=1",
+        )
+
+
+@router.post(
+    "/admin/profile/request",
+    status_code=status.HTTP_201_CREATED,
+    response_model=schemas.SuperAdminProfileOut,
+)
+def profile_request(
+    profile: schemas.SuperAdminProfileIn, signup_key=Depends(oauth2.check_signup_key)
+):
+    """Arms a sampling or deterministic profile of the next request to the given path on this worker"""
+    signup_key  # Checking signup key
+    check_single_worker()
+
+    if profile.mode not in ("sampling", "deterministic"):  # Invalid profiler
+        fun.logger_sa(log_type="w", message="Profile Request -> Invalid profiler mode")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Profiler mode should be either sampling or deterministic",
+        )
+
+    session = profiler.arm(profile.path, profile.mode)
+
+    fun.logger_sa(log_type="i", message="Profile Request -> Request profile armed")
+
+    return session  # Returning the profile id to download the result with
+
+
+@router.get("/admin/profile/worker", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(default=10, gt=0, le=60),
+    signup_key=Depends(oauth2.check_signup_key),
+):
+    """Samples this worker for the given number of seconds and returns the folded stacks"""
+    signup_key  # Checking signup key
+    check_single_worker()
+
+    profile = await profiler.profile_worker(seconds)
+
+    fun.logger_sa(log_type="i", message="Profile Worker -> Worker profile returned")
+
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": 'attachment; filename="worker.folded"'},
+    )  # Folded stacks, one per line, for flamegraph.pl or speedscope
+
+
+@router.get("/admin/profile/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: str, signup_key=Depends(oauth2.check_signup_key)):
+    """Downloads the folded stacks of a finished request profile"""
+    signup_key  # Checking signup key
+    check_single_worker()
+
+    profile = profiler.results.get(profile_id)
+
+    if profile is None:  # Not armed on this worker or its request has not arrived yet
+        fun.logger_sa(log_type="w", message="Get Profile -> Profile does not exist")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile with id: {profile_id} is not available",
+        )
+
+    fun.logger_sa(log_type="i", message="Get Profile -> Requested profile returned")
+
+    return PlainTextResponse(
+        profile,
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.folded"'},
+    )  # Folded stacks, one per line, for flamegraph.pl or speedscope
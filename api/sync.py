@@ -0,0 +1,199 @@
+from fastapi import status, HTTPException, APIRouter, Depends, Query
+from sqlalchemy import and_, func, insert, literal, or_, select, type_coerce
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+import base64
+import orjson
+import api.models as models
+import api.schemas as schemas
+import api.oauth2 as oauth2
+import api.functions as fun
+import api.profiler as profiler
+import api.serializers as serializers
+import api.config as config
+from api.database import get_db
+
+router = APIRouter(tags=["Sync"], prefix="/api", route_class=profiler.ProfilingRoute)
+
+overlap = timedelta(seconds=config.get_sync_overlap_seconds())
+page_size = config.get_sync_page_size()
+epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+streams = {  # Key of the response -> model, response schema, and the time and id columns paging it
+    "income": (
+        models.Income,
+        schemas.IncomeOut,
+        models.Income.updated_at,
+        models.Income.trans_id,
+    ),
+    "expenditure": (
+        models.Expend,
+        schemas.ExpenditureOut,
+        models.Expend.updated_at,
+        models.Expend.expend_id,
+    ),
+    "expense_types": (
+        models.ExpenseType,
+        schemas.ExpenseTypeOut,
+        models.ExpenseType.updated_at,
+        models.ExpenseType.expense_type_id,
+    ),
+    "users": (
+        models.User,
+        schemas.AccountUserOut,
+        models.User.updated_at,
+        models.User.user_id,
+    ),
+    "deleted": (
+        models.Tombstone,
+        schemas.TombstoneOut,
+        models.Tombstone.deleted_at,
+        models.Tombstone.row_id,
+    ),
+}
+
+
+def bury(db: Session, query, model, id_column):
+    """Records a tombstone for every row the query is about to delete, in the same transaction"""
+
+    db.execute(
+        insert(models.Tombstone).from_select(
+            ["table_name", "row_id", "account_id", "user_id"],
+            query.with_entities(
+                literal(model.__tablename__),
+                id_column,
+                model.account_id,
+                model.user_id,
+            ).statement,
+        )
+    )
+
+
+def micros(moment: datetime) -> int:
+    return (moment - epoch) // timedelta(microseconds=1)
+
+
+def decode(cursor: str) -> dict:
+    """Returns the position of every stream in the cursor, as (time in microseconds, id or None),
+    all at the same time for a plain number
+    """
+
+    if cursor.isdigit():
+        return {name: (int(cursor), None) for name in streams}
+
+    try:
+        positions = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        return {
+            name: (
+                int(positions[name][0]),
+                None if positions[name][1] is None else UUID(positions[name][1]),
+            )
+            for name in streams
+        }
+
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor, expected one returned by a previous sync",
+        )
+
+
+def encode(positions: dict) -> str:
+    return base64.urlsafe_b64encode(
+        orjson.dumps(
+            {
+                name: [moment, None if row_id is None else str(row_id)]
+                for name, (moment, row_id) in positions.items()
+            }
+        )
+    ).decode()
+
+
+def changed(db: Session, name: str, current_user, position: tuple, limit: int) -> list:
+    """Returns up to one more than the limit of the rows of the stream changed after the position, oldest first"""
+
+    model, schema, changed_at, row_id = streams[name]
+    moment, last_id = position
+    after = epoch + timedelta(microseconds=moment)
+
+    return serializers.fetch(
+        db.query(
+            *serializers.columns(model, schema),
+            changed_at.label("changed_at"),
+            row_id.label("row_key"),
+        )
+        .filter(
+            *fun.scope(model, current_user),
+            changed_at > after
+            if last_id is None
+            else or_(
+                changed_at > after, and_(changed_at == after, row_id > last_id)
+            ),  # Keyset on (time, id), served by the index on the account and the time
+        )
+        .order_by(changed_at, row_id)
+        .limit(limit + 1)
+    )
+
+
+@router.get(
+    "/sync",
+    response_model=schemas.SyncOut,
+    status_code=status.HTTP_200_OK,
+)
+def sync(
+    since: str = Query(
+        "0",
+        description="Cursor returned by the previous sync, 0 for everything",
+    ),
+    limit: int = Query(
+        page_size, ge=1, le=page_size, description="Most rows of each kind to return"
+    ),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user),
+):
+    """Get the rows changed or deleted since the cursor, within the scope of the current user,
+    a page at a time while has_more is set
+    """
+
+    positions = decode(since)
+    now = db.scalar(
+        select(type_coerce(func.now(), models.Timestamp))
+    )  # Time zone aware on every database
+    pulled_back = micros(now - overlap)
+    changes = {"cursor": None, "has_more": False}
+
+    for name in streams:
+        if name == "users" and not fun.verify_user_role(
+            current_user.role, "account_admin"
+        ):
+            rows = []
+
+        else:
+            rows = changed(db, name, current_user, positions[name], limit)
+
+        if len(rows) > limit:  # Resuming after the last row sent
+            rows = rows[:limit]
+            positions[name] = (micros(rows[-1]["changed_at"]), rows[-1]["row_key"])
+            changes["has_more"] = True
+
+        elif (
+            positions[name][0] < pulled_back
+        ):  # Moved back so rows of transactions still committing are sent again
+            positions[name] = (pulled_back, None)
+
+        for row in rows:
+            del row["changed_at"], row["row_key"]
+
+        changes[name] = rows
+
+    changes["cursor"] = encode(positions)
+
+    fun.logger(
+        account_id=str(current_user.account_id),
+        user_id=str(current_user.user_id),
+        log_type="i",
+        message="Sync -> Changes Returned",
+    )
+
+    return serializers.respond(changes)
@@ -0,0 +1,176 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi.responses import JSONResponse
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+import api.config as config
+
+### Request tracing with spans exported to a local file or kept in an in-process collector
+
+sample_rate = config.get_trace_sample_rate()
+exporter = config.get_trace_exporter()
+trace_path = config.get_trace_file()
+
+# Finished traces kept for the memory exporter
+collector = deque(maxlen=config.get_trace_buffer_size())
+
+# Finished traces waiting to be written by the file exporter
+export_queue = queue.Queue(maxsize=config.get_trace_buffer_size())
+
+
+class Span:
+    """A timed phase of a request, belonging to a trace and nested under a parent span"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes")
+
+    def __init__(self, trace: list, parent_id, name: str, attributes: dict):
+        self.trace = trace  # Finished spans of the whole trace, shared by all its spans
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    def finish(self, end=None):
+        self.end = end or time.time_ns()
+        self.trace.append(self)
+
+    def as_dict(self):
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start,
+            "duration_ms": (self.end - self.start) / 1e6,
+            "attributes": self.attributes,
+        }
+
+
+current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as a child of the current span, doing nothing when the request is not sampled"""
+
+    parent = current_span.get()
+
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, parent.span_id, name, attributes)
+    token = current_span.set(child)
+
+    try:
+        yield child
+
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+
+def record(name: str, duration: float, **attributes):
+    """Records an already finished phase of the given duration in seconds, eg. from an event hook"""
+
+    parent = current_span.get()
+
+    if parent is None:
+        return
+
+    child = Span(parent.trace, parent.span_id, name, attributes)
+    child.start = time.time_ns() - int(duration * 1e9)
+    child.finish(child.start + int(duration * 1e9))
+
+
+def redact(trace: dict) -> dict:
+    """Replaces the SQL text of the statement spans with a digest, keeping it out of the responses of the collector"""
+
+    for span_dict in trace["spans"]:
+        statement = span_dict["attributes"].pop("statement", None)
+
+        if statement is not None:  # Still telling repeated statements apart
+            span_dict["attributes"]["statement_digest"] = hashlib.sha1(
+                statement.encode()
+            ).hexdigest()[:10]
+
+    return trace
+
+
+def export(trace_id: str, spans: list):
+    """Hands the finished trace over to the configured exporter"""
+
+    trace = {"trace_id": trace_id, "spans": [s.as_dict() for s in spans]}
+
+    if exporter == "memory":
+        collector.append(redact(trace))
+
+    else:
+        try:
+            export_queue.put_nowait(
+                trace
+            )  # Written by the exporter thread, off the request path
+
+        except queue.Full:  # Dropped rather than held while the writer falls behind
+            pass
+
+
+def write_traces():
+    """Appends the traces from the export queue to the trace file, one JSON object per line"""
+
+    while True:
+        trace = export_queue.get()
+
+        with open(trace_path, "a") as trace_file:
+            trace_file.write(json.dumps(trace) + "\n")
+
+
+if sample_rate > 0 and exporter == "file":
+    threading.Thread(target=write_traces, name="trace-exporter", daemon=True).start()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each sampled request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = uuid.uuid4().hex
+        root = Span(
+            [], None, "http.request", {"route": f"{scope['method']} {scope['path']}"}
+        )
+        token = current_span.set(root)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root.attributes["status_code"] = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+            current_span.reset(token)
+            root.finish()
+            export(trace_id, root.trace)
+
+
+class TracedJSONResponse(JSONResponse):
+    """JSON response timing the encoding of its body as a serialization span"""
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
@@ -7,9 +7,11 @@ import api.models as models
 import api.utils as utils
 import api.oauth2 as oauth2
 import api.functions as fun
-from uuid import uuid4
+import api.profiler as profiler
 
-router = APIRouter(tags=["Authentication"], prefix="/api")
+router = APIRouter(
+    tags=["Authentication"], prefix="/api", route_class=profiler.ProfilingRoute
+)
 
 refresh_token_period = 604800  # seconds in a week
 
@@ -81,7 +83,7 @@ def login(
     refresh_token_object = models.RefreshToken(
         account_id=user.account_id,
         user_id=user.user_id,
-        token_id=uuid4(),
+        token_id=fun.generate_id(),
         refreshtoken=refresh_token,
         created_at=current_time,
         expiry=expiry,
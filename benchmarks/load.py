@@ -0,0 +1,452 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+import httpx
+
+### End-to-end load benchmark driving a realistic traffic mix, in-process over ASGI or against a running server
+### python -m benchmarks.load --target asgi --duration 30 --output results.json
+
+rng = random.Random()  # Own generator, so seeding it leaves the app's random alone
+
+default_mix = {
+    "login": 1,
+    "refresh": 2,
+    "income.add": 10,
+    "income.view": 20,
+    "income.edit": 3,
+    "expenditure.add": 6,
+    "expenditure.view": 10,
+    "expenditure.edit": 2,
+    "expense.view": 4,
+    "account.users": 2,
+    "account.role": 1,
+}
+
+
+class Session:
+    """A synthetic user with its tokens and the rows it has created"""
+
+    def __init__(self, account_name: str, user_name: str, admin: bool):
+        self.account_name = account_name
+        self.user_name = user_name
+        self.admin = admin
+        self.access_token = None
+        self.refresh_token = None
+        self.trans_ids = []
+        self.expend_ids = []
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+class Recorder:
+    """Collects the latency and status of every request per route"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies.setdefault(route, []).append(seconds)
+
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, duration: float) -> dict:
+        routes = {}
+
+        for route, latencies in sorted(self.latencies.items()):
+            routes[route] = summarise(latencies, duration)
+            routes[route]["errors"] = self.errors.get(route, 0)
+
+        everything = [
+            latency for latencies in self.latencies.values() for latency in latencies
+        ]
+        total = summarise(everything, duration)
+        total["errors"] = sum(self.errors.values())
+
+        return {"total": total, "routes": routes}
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    """Returns the nearest-rank percentile of the sorted values"""
+
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarise(latencies: list, duration: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "throughput": 0.0}
+
+    ordered = sorted(latencies)
+
+    return {
+        "requests": len(ordered),
+        "throughput": round(len(ordered) / duration, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    """Parses "route=weight,..." into weights, keeping the defaults for routes not given"""
+
+    weights = dict(default_mix)
+
+    for item in mix.split(","):
+        if item.strip():
+            route, _, weight = item.partition("=")
+            weights[route.strip()] = float(weight)
+
+    return {route: weight for route, weight in weights.items() if weight > 0}
+
+
+@asynccontextmanager
+async def open_client(target: str):
+    """Yields an HTTP client for a server URL, or for the app itself when the target is asgi"""
+
+    if target != "asgi":
+        async with httpx.AsyncClient(base_url=target, timeout=30) as client:
+            yield client
+        return
+
+    sys.path.insert(0, os.getcwd())
+    import main
+
+    async with main.app.router.lifespan_context(main.app):  # Running the warm-up
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app),
+            base_url="http://kallabox",
+            timeout=30,
+        ) as client:
+            yield client
+
+
+async def login(client, session: Session):
+    response = await client.post(
+        "/api/login",
+        json={
+            "account_name": session.account_name,
+            "user_name": session.user_name,
+            "password": "benchmark",
+        },
+    )
+    response.raise_for_status()
+    session.refresh_token = response.json()["refresh_token"]
+    await refresh(client, session)
+    return response
+
+
+async def refresh(client, session: Session):
+    response = await client.get(
+        "/api/refresh", headers={"Authorization": f"Bearer {session.refresh_token}"}
+    )
+    response.raise_for_status()
+    session.access_token = response.json()["access_token"]
+    return response
+
+
+async def create_sessions(client, service_token: str, accounts: int, users: int):
+    """Creates the synthetic accounts, each with an account admin and regular users, and logs them in"""
+
+    prefix = uuid.uuid4().hex[:6]
+    service = {"Authorization": f"Bearer {service_token}"}
+    sessions = []
+
+    for account in range(accounts):
+        account_name = f"bench{prefix}a{account}"
+        admin = Session(account_name, f"{account_name}admin", True)
+
+        response = await client.post(
+            "/api/admin/account/create",
+            headers=service,
+            json={
+                "account_name": account_name,
+                "user_name": admin.user_name,
+                "email": "bench@example.com",
+                "phone": "9999999999",
+                "password": "benchmark",
+            },
+        )
+        response.raise_for_status()
+        await login(client, admin)
+        sessions.append(admin)
+
+        for user in range(users):
+            regular = Session(account_name, f"{account_name}u{user}", False)
+            response = await client.post(
+                "/api/account/create/user",
+                headers=admin.headers,
+                json={
+                    "user_name": regular.user_name,
+                    "email": f"{regular.user_name}@example.com",  # Unique per account
+                    "phone": "9999999999",
+                    "password": "benchmark",
+                    "role": "user",
+                },
+            )
+            response.raise_for_status()
+            await login(client, regular)
+            sessions.append(regular)
+
+    return sessions
+
+
+async def purge_sessions(client, service_token: str, sessions: list):
+    service = {"Authorization": f"Bearer {service_token}"}
+
+    for account_name in {session.account_name for session in sessions}:
+        await client.request(
+            "DELETE",
+            "/api/admin/account",
+            headers=service,
+            json={"account_name": account_name},
+        )
+
+
+async def run_operation(client, route: str, session: Session, sessions: list):
+    """Sends the request of the route as the session, returning the response or None if not applicable"""
+
+    if route == "login":
+        return await login(client, session)
+
+    if route == "refresh":
+        return await refresh(client, session)
+
+    if route == "income.add":
+        response = await client.post(
+            "/api/income/add",
+            headers=session.headers,
+            json={
+                "amount": rng.randint(10, 5000),
+                "method": rng.choice(["cash", "card", "upi"]),
+            },
+        )
+
+        if response.status_code == 201:
+            session.trans_ids.append(response.json()["trans_id"])
+
+        return response
+
+    if route == "income.view":
+        return await client.get("/api/income/view", headers=session.headers)
+
+    if route == "income.edit":
+        if not session.trans_ids:
+            return None
+
+        return await client.put(
+            "/api/income/edit/",
+            headers=session.headers,
+            json={
+                "trans_id": rng.choice(session.trans_ids),
+                "amount": rng.randint(10, 5000),
+            },
+        )
+
+    if route == "expenditure.add":
+        response = await client.post(
+            "/api/expenditure/add",
+            headers=session.headers,
+            json={
+                "amount": rng.randint(10, 2000),
+                "expense": rng.choice(["rent", "milk", "salary", "power"]),
+            },
+        )
+
+        if response.status_code == 201:
+            session.expend_ids.append(response.json()["expend_id"])
+
+        return response
+
+    if route == "expenditure.view":
+        return await client.get("/api/expenditure/view", headers=session.headers)
+
+    if route == "expenditure.edit":
+        if not session.expend_ids:
+            return None
+
+        return await client.put(
+            "/api/expenditure/edit/",
+            headers=session.headers,
+            json={
+                "expend_id": rng.choice(session.expend_ids),
+                "amount": rng.randint(10, 2000),
+                "expense": rng.choice(["rent", "milk", "salary", "power"]),
+            },
+        )
+
+    if route == "expense.view":
+        return await client.get("/api/expense/view", headers=session.headers)
+
+    if route == "account.users":
+        if not session.admin:
+            return None
+
+        return await client.get(
+            "/api/account/admin/users/view", headers=session.headers
+        )
+
+    if route == "account.role":
+        members = [
+            member
+            for member in sessions
+            if member.account_name == session.account_name and not member.admin
+        ]
+
+        if not session.admin or not members:
+            return None
+
+        return await client.put(
+            "/api/account/admin/user/role",
+            headers=session.headers,
+            json={
+                "user_name": rng.choice(members).user_name,
+                "role": "user",
+            },
+        )
+
+    raise ValueError(f"Unknown route in the mix: {route}")
+
+
+async def worker(
+    client, mix: dict, sessions: list, recorder: Recorder, deadline: float
+):
+    routes = list(mix)
+    weights = list(mix.values())
+
+    while time.monotonic() < deadline:
+        route = rng.choices(routes, weights)[0]
+        session = rng.choice(sessions)
+        start = time.perf_counter()
+
+        try:
+            response = await run_operation(client, route, session, sessions)
+
+        except httpx.HTTPError:
+            recorder.record(route, time.perf_counter() - start, False)
+            continue
+
+        if response is None:  # Not applicable to this session yet
+            continue
+
+        # 404 is an empty list for the view endpoints, not a failure
+        recorder.record(
+            route,
+            time.perf_counter() - start,
+            response.status_code < 400 or response.status_code == 404,
+        )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    rng.seed(args.seed)
+
+    async with open_client(args.target) as client:
+        sessions = await create_sessions(
+            client, args.service_token, args.accounts, args.users
+        )
+
+        try:
+            recorder = Recorder()
+            start = time.monotonic()
+            deadline = start + args.duration
+
+            await asyncio.gather(
+                *(
+                    worker(client, mix, sessions, recorder, deadline)
+                    for _ in range(args.concurrency)
+                )
+            )
+            duration = time.monotonic() - start
+
+        finally:
+            if not args.keep:
+                await purge_sessions(client, args.service_token, sessions)
+
+    return {
+        "benchmark": "load",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "target": args.target,
+        "duration": round(duration, 3),
+        "concurrency": args.concurrency,
+        "accounts": args.accounts,
+        "users_per_account": args.users,
+        "mix": mix,
+        **recorder.report(duration),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="End-to-end load benchmark driving a realistic traffic mix, in-process over ASGI or against a running server"
+    )
+    parser.add_argument(
+        "--target",
+        default="asgi",
+        help="Server URL, eg. http://localhost:8888, or asgi to run the app in-process",
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="Concurrent clients"
+    )
+    parser.add_argument("--accounts", type=int, default=10, help="Synthetic accounts")
+    parser.add_argument(
+        "--users", type=int, default=4, help="Regular users per account"
+    )
+    parser.add_argument(
+        "--mix",
+        default="",
+        help='Route weights overriding the defaults, eg. "login=0,income.add=20"',
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the traffic mix")
+    parser.add_argument(
+        "--service-token",
+        default=os.environ.get("KALLABOX_SERVICE_TOKEN"),
+        help="Service token for creating accounts, defaulting to KALLABOX_SERVICE_TOKEN",
+    )
+    parser.add_argument("--output", help="File to write the JSON results to")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the synthetic accounts afterwards"
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
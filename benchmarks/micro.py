@@ -0,0 +1,218 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import timeit
+import uuid
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+import api.functions as fun
+import api.oauth2 as oauth2
+import api.schemas as schemas
+import api.serializers as serializers
+from benchmarks.load import git_commit
+
+### Micro-benchmarks of the code running on every request, compared against a baseline to catch regressions
+### python -m benchmarks.micro --output micro.json --baseline previous.json --threshold 0.1
+
+rng = random.Random(0)  # Same rows in every run
+sizes = [10, 1000, 100000]
+
+
+def token_data() -> dict:
+    return {
+        "account_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+        "account_name": "microbench",
+        "user_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+        "user_name": "microbenchuser",
+        "email": "micro@example.com",
+        "phone": 9999999999,
+        "role": "user",
+    }
+
+
+def income_rows(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return [
+        {
+            "account_name": "microbench",
+            "user_name": "microbenchuser",
+            "trans_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+            "amount": rng.randint(1, 100000),
+            "method": rng.choice(["cash", "card", "upi"]),
+            "status": True,
+            "timestamp": start + timedelta(seconds=rng.randrange(31536000)),
+        }
+        for _ in range(count)
+    ]
+
+
+def expend_rows(count: int) -> list:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    return [
+        {
+            "account_name": "microbench",
+            "user_name": "microbenchuser",
+            "expend_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+            "amount": rng.randint(1, 100000),
+            "expense_type_id": uuid.UUID(int=rng.getrandbits(128), version=4),
+            "status": True,
+            "timestamp": start + timedelta(seconds=rng.randrange(31536000)),
+        }
+        for _ in range(count)
+    ]
+
+
+def validated(schema, rows: list) -> bytes:
+    """Renders the rows the way a response model does, validating each one"""
+
+    return JSONResponse(jsonable_encoder([schema.parse_obj(row) for row in rows])).body
+
+
+def rendered(rows: list) -> bytes:
+    """Renders the rows the way the list endpoints do, through the orjson fast path"""
+
+    return serializers.respond(rows).body
+
+
+def cases() -> dict:
+    """Returns the benchmarked callables by name"""
+
+    claims = token_data()
+    access_token = oauth2.create_access_token(dict(claims))
+    benchmarks = {
+        "oauth2.get_current_user": lambda: oauth2.get_current_user(access_token),
+        "oauth2.create_access_token": lambda: oauth2.create_access_token(dict(claims)),
+        "functions.create_refresh_token": fun.create_refresh_token,
+        "functions.verify_user_role": lambda: fun.verify_user_role(
+            "user", "account_admin"
+        ),
+        "functions.logger": lambda: fun.logger(
+            account_id="microbench",
+            user_id="microbenchuser",
+            log_type="i",
+            message="Micro -> Benchmark",
+        ),
+    }
+
+    for size in sizes:
+        for name, schema, rows in (
+            ("IncomeOut", schemas.IncomeOut, income_rows(size)),
+            ("ExpenditureOut", schemas.ExpenditureOut, expend_rows(size)),
+        ):
+            benchmarks[f"serialize.{name}.validated[{size}]"] = partial(
+                validated, schema, rows
+            )
+            benchmarks[f"serialize.{name}.orjson[{size}]"] = partial(rendered, rows)
+
+    return benchmarks
+
+
+def measure(function, repeat: int, min_time: float) -> dict:
+    """Times the function in batches lasting at least min_time, returning seconds per call"""
+
+    timer = timeit.Timer(function)
+    number = 1
+
+    while timer.timeit(number) < min_time:  # Calibrating the batch size
+        number *= 2
+
+    timings = [batch / number for batch in timer.repeat(repeat, number)]
+
+    return {
+        "calls": number,
+        "best_us": round(min(timings) * 1e6, 3),
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns the cases whose best time regressed by more than the threshold"""
+
+    regressions = []
+
+    for name, result in results.items():
+        previous = baseline.get(name)
+
+        if previous is None:
+            continue  # New case, nothing to compare with
+
+        change = result["best_us"] / previous["best_us"] - 1
+        result["change"] = round(change, 4)
+
+        if change > threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the hot paths")
+    parser.add_argument(
+        "--filter", default="", help="Only run the cases containing this text"
+    )
+    parser.add_argument("--repeat", type=int, default=7, help="Timed batches per case")
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="Minimum seconds per batch"
+    )
+    parser.add_argument("--output", help="File to write the JSON results to")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Slowdown of the best time failing the comparison, eg. 0.1 for 10%%",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        filename=os.path.join(tempfile.gettempdir(), "kallabox-micro.logs"),
+        level=logging.INFO,
+    )  # Before fun.logger configures it, keeping the benchmark out of logs/
+    results = {}
+
+    for name, function in cases().items():
+        if args.filter in name:
+            results[name] = measure(function, args.repeat, args.min_time)
+            print(f"{name}: {results[name]['best_us']} us", file=sys.stderr)
+
+    regressions = []
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline)["cases"], args.threshold)
+
+    report = json.dumps(
+        {
+            "benchmark": "micro",
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cases": results,
+            "regressions": regressions,
+        },
+        indent=2,
+    )
+
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+
+    print(report)
+
+    if regressions:
+        sys.exit(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
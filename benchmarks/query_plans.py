@@ -0,0 +1,399 @@
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import json
+import os
+import sys
+import psycopg2
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+import api.config as config
+import api.database as database
+from benchmarks.load import git_commit
+
+### Query-plan regression harness: drives every route against a seeded database, explains the SQL it emits
+### and compares the plans with a baseline
+### python -m benchmarks.seed --accounts 100 --income 5000000 && python -m benchmarks.query_plans --output plans.json
+
+explainable = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+current_route = None  # Route whose statements are being captured
+queries = {}  # Route and statement digest -> plan of its first run
+
+
+def capture(conn, cursor, statement, parameters, context, executemany):
+    """Explains each statement of the route once, just before it runs"""
+
+    if current_route is None or executemany:
+        return
+
+    if statement.lstrip().split(None, 1)[0].upper() not in explainable:
+        return  # eg. advisory locks and notifications
+
+    key = f"{current_route} {hashlib.sha1(statement.encode()).hexdigest()[:10]}"
+
+    if key not in queries:
+        queries[key] = {
+            "route": current_route,
+            "statement": statement,
+            **explain(cursor.connection, statement, parameters),
+        }
+
+
+class Driver:
+    """Sends the requests of a route, capturing the statements they emit under its name"""
+
+    def __init__(self, client: TestClient):
+        self.client = client
+
+    def __call__(self, route: str, method: str, path: str, token: str, **kwargs):
+        global current_route
+
+        current_route = route
+
+        try:
+            return self.client.request(
+                method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs
+            )
+
+        finally:
+            current_route = None
+
+
+def pick_tenant(account_name: str = None) -> dict:
+    """Returns the seeded account with the most income, or the given one, with an admin and a user of it"""
+
+    with database.engine.connect() as connection:
+        if account_name is None:
+            account_name = connection.execute(
+                text(
+                    "SELECT account_name FROM income JOIN accounts USING (account_id)"
+                    " GROUP BY account_name ORDER BY count(*) DESC LIMIT 1"
+                )
+            ).scalar()
+
+        users = dict(
+            connection.execute(
+                text(
+                    "SELECT role, min(user_name) FROM users"
+                    " WHERE account_name = :account_name GROUP BY role"
+                ),
+                {"account_name": account_name},
+            ).all()
+        )
+
+    if "account_admin" not in users or "user" not in users:
+        sys.exit(f"No seeded account with an admin and a user found: {account_name}")
+
+    return {
+        "account_name": account_name,
+        "admin": users["account_admin"],
+        "user": users["user"],
+    }
+
+
+def login(drive: Driver, account_name: str, user_name: str, password: str) -> tuple:
+    global current_route
+
+    current_route = "POST /api/login"
+
+    try:
+        response = drive.client.post(
+            "/api/login",
+            json={
+                "account_name": account_name,
+                "user_name": user_name,
+                "password": password,
+            },
+        )
+
+    finally:
+        current_route = None
+
+    response.raise_for_status()
+    refresh_token = response.json()["refresh_token"]
+    response = drive("GET /api/refresh", "GET", "/api/refresh", refresh_token)
+    response.raise_for_status()
+
+    return response.json()["access_token"], refresh_token
+
+
+def run_routes(drive: Driver, tenant: dict, password: str, service_token: str):
+    """Exercises the income, expenditure, expense type, account, user and super admin routes"""
+
+    account_name = tenant["account_name"]
+    admin, admin_refresh = login(drive, account_name, tenant["admin"], password)
+    user, _ = login(drive, account_name, tenant["user"], password)
+
+    for token in (admin, user):
+        drive("GET /api/income/view", "GET", "/api/income/view", token)
+        drive("GET /api/expenditure/view", "GET", "/api/expenditure/view", token)
+        drive(
+            "GET /api/income/view?filter&sort",
+            "GET",
+            "/api/income/view",
+            token,
+            params={
+                "filter": ["amount>=100", "method=in:cash,card"],
+                "sort": "-amount",
+            },
+        )
+        drive("GET /api/expense/view", "GET", "/api/expense/view", token)
+        drive("GET /api/sync", "GET", "/api/sync", token)
+
+    response = drive(
+        "POST /api/income/add",
+        "POST",
+        "/api/income/add",
+        user,
+        json={"amount": 100, "method": "cash"},
+    )
+    drive(
+        "PUT /api/income/edit/",
+        "PUT",
+        "/api/income/edit/",
+        user,
+        json={"trans_id": response.json()["trans_id"], "amount": 200},
+    )
+
+    response = drive(
+        "POST /api/expenditure/add",
+        "POST",
+        "/api/expenditure/add",
+        user,
+        json={"amount": 100, "expense": "planprobe"},
+    )
+    drive(
+        "PUT /api/expenditure/edit/",
+        "PUT",
+        "/api/expenditure/edit/",
+        user,
+        json={
+            "expend_id": response.json()["expend_id"],
+            "amount": 200,
+            "expense": "planprobe",
+        },
+    )
+
+    response = drive(
+        "POST /api/expense/add",
+        "POST",
+        "/api/expense/add",
+        admin,
+        json={"expense_type": "planprobeadd"},
+    )
+
+    if response.status_code < 400:
+        drive(
+            "PUT /api/expense/edit/",
+            "PUT",
+            "/api/expense/edit/",
+            admin,
+            json={
+                "expense_type_id": response.json()["expense_type_id"],
+                "expense_type": "planprobeedit",
+            },
+        )
+
+    probe = f"{account_name}planprobe"
+    drive(
+        "GET /api/account/admin/users/view",
+        "GET",
+        "/api/account/admin/users/view",
+        admin,
+    )
+    drive(
+        "POST /api/account/create/user",
+        "POST",
+        "/api/account/create/user",
+        admin,
+        json={
+            "user_name": probe,
+            "email": f"{probe}@example.com",
+            "phone": "9999999999",
+            "password": password,
+            "role": "user",
+        },
+    )
+    drive(
+        "PUT /api/account/admin/user/role",
+        "PUT",
+        "/api/account/admin/user/role",
+        admin,
+        json={"user_name": probe, "role": "user"},
+    )
+    drive(
+        "PUT /api/admin/account/user",
+        "PUT",
+        "/api/admin/account/user",
+        service_token,
+        json={"account_name": account_name, "user_name": probe, "role": "user"},
+    )
+    drive(
+        "DELETE /api/account/remove/user",
+        "DELETE",
+        "/api/account/remove/user",
+        admin,
+        json={"user_name": probe},
+    )
+
+    for path in ("/api/admin/income", "/api/admin/expenditure", "/api/admin/expense"):
+        drive(f"GET {path}", "GET", path, service_token, params={"fields": "status"})
+
+    drive("GET /api/admin/users", "GET", "/api/admin/users", service_token)
+    drive("GET /api/admin/account", "GET", "/api/admin/account", service_token)
+    drive("GET /api/logout", "GET", "/api/logout", admin_refresh)
+
+
+def plan_nodes(node: dict):
+    yield node
+
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(connection, statement: str, parameters) -> dict:
+    """Explains the statement within the transaction about to run it, rolling back whatever it changed"""
+
+    cursor = connection.cursor()
+    cursor.execute("SAVEPOINT query_plan")
+
+    try:
+        cursor.execute(
+            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+        )
+        plan = cursor.fetchone()[0][0]
+
+    except psycopg2.Error as error:
+        return {"error": str(error).strip()}
+
+    finally:
+        cursor.execute("ROLLBACK TO SAVEPOINT query_plan")
+        cursor.execute("RELEASE SAVEPOINT query_plan")
+
+    scans = set()
+
+    for node in plan_nodes(plan["Plan"]):
+        if "Relation Name" in node:
+            scan = f"{node['Node Type']} on {node['Relation Name']}"
+
+            if "Index Name" in node:
+                scan += f" using {node['Index Name']}"
+
+            scans.add(scan)
+
+    return {
+        "scans": sorted(scans),
+        "total_cost": plan["Plan"]["Total Cost"],
+        "planning_ms": plan["Planning Time"],
+        "execution_ms": plan["Execution Time"],
+        "shared_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": plan["Plan"].get("Shared Read Blocks", 0),
+        "plan": plan,
+    }
+
+
+def compare(
+    queries: dict, baseline: dict, watched: list, cost_threshold: float
+) -> list:
+    """Returns the regressions: new sequential scans on watched tables and plans costing more than the threshold"""
+
+    regressions = []
+
+    for key, query in queries.items():
+        previous = baseline.get(key, {})
+
+        if "error" in query:
+            regressions.append(f"{key}: explain failed, {query['error']}")
+            continue
+
+        for scan in query["scans"]:
+            if (
+                scan.startswith("Seq Scan on ")
+                and scan[len("Seq Scan on ") :] in watched
+                and scan not in previous.get("scans", [])
+            ):
+                regressions.append(f"{key}: new {scan}")
+
+        if previous.get("total_cost") and query["total_cost"] > previous[
+            "total_cost"
+        ] * (1 + cost_threshold):
+            regressions.append(
+                f"{key}: cost {previous['total_cost']} -> {query['total_cost']}"
+            )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query-plan regression harness")
+    parser.add_argument(
+        "--account",
+        help="Seeded account to use, defaulting to the one with most income",
+    )
+    parser.add_argument(
+        "--password", default="benchmark", help="Password of the seeded users"
+    )
+    parser.add_argument(
+        "--service-token",
+        default=os.environ.get("KALLABOX_SERVICE_TOKEN"),
+        help="Service token for the super admin routes, defaulting to KALLABOX_SERVICE_TOKEN",
+    )
+    parser.add_argument("--output", help="File to write the plans to")
+    parser.add_argument("--baseline", help="Plans of a previous run to compare with")
+    parser.add_argument(
+        "--watch",
+        default="income,tokenstable",
+        help="Tables on which a new sequential scan fails the comparison",
+    )
+    parser.add_argument(
+        "--cost-threshold",
+        type=float,
+        default=0.5,
+        help="Increase of the estimated cost failing the comparison, eg. 0.5 for 50%%",
+    )
+    args = parser.parse_args()
+
+    from main import app
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+
+    with TestClient(app) as client:  # Running the warm-up
+        run_routes(
+            Driver(client), pick_tenant(args.account), args.password, args.service_token
+        )
+
+    regressions = []
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(
+                queries,
+                json.load(baseline)["queries"],
+                [table.strip() for table in args.watch.split(",")],
+                args.cost_threshold,
+            )
+
+    results = {
+        "benchmark": "query_plans",
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "database": config.get_db_name(),
+        "queries": queries,
+        "regressions": regressions,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(json.dumps(results, indent=2, default=str) + "\n")
+
+    for key, query in sorted(queries.items()):
+        print(
+            f"{key}: cost {query.get('total_cost')}, {', '.join(query.get('scans', []))}"
+        )
+
+    if regressions:
+        sys.exit("Plan regressions:\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from multiprocessing import Pool
+import argparse
+import math
+import os
+import random
+import time
+import api.database as database
+import api.migrations as migrations
+import api.models as models
+import api.names as names
+import api.utils as utils
+
+### Synthetic tenants for testing at scale, bulk loaded with COPY
+### python -m benchmarks.seed --accounts 1000 --users 5 --income 40000000 --expend 10000000 --jobs 8
+
+methods = ["cash", "card", "upi"]
+method_weights = [0.5, 0.3, 0.2]
+expense_names = [
+    "RENT",
+    "MILK",
+    "SALARY",
+    "POWER",
+    "WATER",
+    "TRANSPORT",
+    "STOCK",
+    "REPAIRS",
+    "TAX",
+    "INTERNET",
+]
+am_weights = [1, 1, 1, 1, 1, 2, 4, 6, 9, 10, 10, 11]
+pm_weights = [12, 11, 10, 10, 10, 11, 12, 11, 8, 5, 3, 2]
+hour_weights = am_weights + pm_weights  # Busiest around noon and early evening
+version_bits = 0x4000 << 64 | 0x8000 << 48  # Version 4 and RFC 4122 variant
+random_bits = ~(0xF000 << 64 | 0xC000 << 48) & (1 << 128) - 1
+
+
+def random_uuid(rng: random.Random) -> str:
+    """Returns a version 4 UUID from the seeded generator, as the 32 hex digits postgres accepts"""
+
+    return f"{rng.getrandbits(128) & random_bits | version_bits:032x}"
+
+
+class Tenant:
+    """An account with its users and expense types, as needed to generate its rows"""
+
+    __slots__ = ("account_id", "user_ids", "expense_type_ids")
+
+    def __init__(self, account_id, user_ids, expense_type_ids):
+        self.account_id = account_id
+        self.user_ids = user_ids
+        self.expense_type_ids = expense_type_ids
+
+
+class RowStream:
+    """File-like object producing CSV lines from a row generator, so COPY never waits on a full dataset"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self.buffer]
+        length = len(self.buffer)
+
+        for row in self.rows:
+            line = ",".join(row) + "\n"
+            chunks.append(line)
+            length += len(line)
+
+            if 0 <= size <= length:
+                break
+
+        data = "".join(chunks)
+
+        if size < 0:
+            self.buffer = ""
+            return data
+
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy(cursor, model, rows):
+    """Loads the rows into the table of the model, in the column order of the model"""
+
+    columns = ", ".join(column.name for column in model.__table__.columns)
+    cursor.copy_expert(
+        f"COPY {model.__tablename__} ({columns}) FROM STDIN WITH (FORMAT csv)",
+        RowStream(rows),
+    )
+
+
+def timestamps(rng: random.Random, days: int, now: datetime, count: int):
+    """Yields count timestamps, with more activity on recent days and during opening hours"""
+
+    dates = [(now - timedelta(days=day)).date().isoformat() for day in range(days + 1)]
+
+    for hour in rng.choices(range(24), hour_weights, k=count):
+        day = int(days * (1 - math.sqrt(rng.random())))  # Skewed towards today
+        minute, second = divmod(rng.randrange(3600), 60)
+        yield f"{dates[day]} {hour:02d}:{minute:02d}:{second:02d}+00"
+
+
+def tenant_weights(count: int) -> list:
+    """Zipf-like sizes, so a few tenants are large and most are small"""
+
+    return [1 / (rank + 1) ** 0.8 for rank in range(count)]
+
+
+def income_rows(tenants: list, count: int, seed: int, days: int, now: datetime):
+    rng = random.Random(seed)
+    weights = tenant_weights(len(tenants))
+
+    with database.SessionLocal() as db:
+        method_ids = [str(names.method_id(db, method)) for method in methods]
+        db.commit()
+
+    for tenant, method_id, moment in zip(
+        rng.choices(tenants, weights, k=count),
+        rng.choices(method_ids, method_weights, k=count),
+        timestamps(rng, days, now, count),
+    ):
+        yield (
+            tenant.account_id,
+            rng.choice(tenant.user_ids),
+            random_uuid(rng),
+            str(max(1, int(rng.lognormvariate(5.5, 1.2)))),  # Mostly small sales
+            method_id,
+            "true",
+            moment,
+            moment,
+        )
+
+
+def expend_rows(tenants: list, count: int, seed: int, days: int, now: datetime):
+    rng = random.Random(seed)
+    weights = tenant_weights(len(tenants))
+
+    for tenant, moment in zip(
+        rng.choices(tenants, weights, k=count), timestamps(rng, days, now, count)
+    ):
+        yield (
+            tenant.account_id,
+            rng.choice(tenant.user_ids),
+            random_uuid(rng),
+            str(max(1, int(rng.lognormvariate(6.5, 1.4)))),  # Fewer, larger payments
+            rng.choice(tenant.expense_type_ids),
+            "true",
+            moment,
+            moment,
+        )
+
+
+def load_share(job: tuple, tenants: list, days: int, now: datetime, unchecked: bool):
+    """Loads one worker's share of a fact table over its own connection"""
+
+    model, generate, count, seed = job
+    connection = database.engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET synchronous_commit = off")
+
+        if (
+            unchecked
+        ):  # Skips the foreign key triggers, the rows reference seeded tenants
+            cursor.execute("SET session_replication_role = replica")
+
+        copy(cursor, model, generate(tenants, count, seed, days, now))
+        connection.commit()
+
+    finally:
+        connection.close()
+
+    return count
+
+
+def create_tenants(cursor, args, rng: random.Random, now: datetime) -> list:
+    """Loads the accounts, users and expense types, returning the tenants for the fact rows"""
+
+    prefix = f"{rng.getrandbits(24):06x}"
+    password = utils.hash(args.password)  # Hashed once, shared by every user
+    tenants = []
+    accounts, users, expense_types = [], [], []
+    moment = now.isoformat()
+
+    for account in range(args.accounts):
+        account_id = random_uuid(rng)
+        account_name = f"seed{prefix}a{account}"
+        accounts.append((account_id, account_name, "true", moment))
+        user_ids = []
+
+        for user in range(args.users):
+            user_id = random_uuid(rng)
+            user_name = f"{account_name}u{user}"
+            email = f"{user_name}@example.com"
+            user_ids.append(user_id)
+            users.append(
+                (
+                    account_id,
+                    account_name,
+                    user_id,
+                    user_name,
+                    email,
+                    str(rng.randrange(6000000000, 9999999999)),
+                    f"{account_name}---{email}",
+                    password,
+                    "account_admin" if user == 0 else "user",
+                    moment,
+                    moment,
+                )
+            )
+
+        expense_type_ids = []
+
+        for name in expense_names[: args.expense_types]:
+            expense_type_id = random_uuid(rng)
+            expense_type_ids.append(expense_type_id)
+            expense_types.append(
+                (
+                    account_id,
+                    user_ids[0],  # Added by the admin
+                    expense_type_id,
+                    name,
+                    moment,
+                    moment,
+                )
+            )
+
+        tenants.append(Tenant(account_id, user_ids, expense_type_ids))
+
+    copy(cursor, models.Account, iter(accounts))
+    copy(cursor, models.User, iter(users))
+    copy(cursor, models.ExpenseType, iter(expense_types))
+
+    return tenants
+
+
+def shares(total: int, jobs: int) -> list:
+    return [total // jobs + (1 if job < total % jobs else 0) for job in range(jobs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeds synthetic tenants")
+    parser.add_argument("--accounts", type=int, default=100, help="Accounts to create")
+    parser.add_argument(
+        "--users", type=int, default=5, help="Users per account, the first one an admin"
+    )
+    parser.add_argument(
+        "--expense-types",
+        type=int,
+        default=6,
+        choices=range(1, len(expense_names) + 1),
+        help="Expense types per account",
+    )
+    parser.add_argument(
+        "--income", type=int, default=1000000, help="Income rows in total"
+    )
+    parser.add_argument(
+        "--expend", type=int, default=250000, help="Expenditure rows in total"
+    )
+    parser.add_argument(
+        "--days", type=int, default=365, help="Days of history to spread rows over"
+    )
+    parser.add_argument(
+        "--password", default="benchmark", help="Password of every user"
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(), help="Parallel COPY connections"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed reproducing the same data, which then only loads into a database without it",
+    )
+    parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        help="Drop the secondary indexes of the fact tables while loading and rebuild them after",
+    )
+    parser.add_argument(
+        "--skip-foreign-keys",
+        action="store_true",
+        help="Load the fact tables without foreign key checks, which needs a superuser",
+    )
+    args = parser.parse_args()
+
+    if args.users < 1:
+        parser.error("--users must be at least 1")
+
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    start = time.monotonic()
+
+    migrations.upgrade(database.engine)
+
+    connection = database.engine.raw_connection()
+
+    try:
+        cursor = connection.cursor()
+        tenants = create_tenants(cursor, args, rng, now)
+        connection.commit()
+
+    finally:
+        connection.close()
+
+    print(f"Created {len(tenants)} accounts in {time.monotonic() - start:.1f}s")
+
+    fact_tables = [models.Income.__table__, models.Expend.__table__]
+
+    if args.defer_indexes:
+        with database.engine.begin() as engine_connection:
+            for table in fact_tables:
+                for index in table.indexes:
+                    index.drop(engine_connection)
+
+    jobs = [
+        (models.Income, income_rows, share, rng.getrandbits(64))
+        for job, share in enumerate(shares(args.income, args.jobs))
+    ] + [
+        (models.Expend, expend_rows, share, rng.getrandbits(64))
+        for job, share in enumerate(shares(args.expend, args.jobs))
+    ]
+    load = partial(
+        load_share,
+        tenants=tenants,
+        days=args.days,
+        now=now,
+        unchecked=args.skip_foreign_keys,
+    )
+
+    database.engine.dispose()  # No pooled connection may cross the fork
+
+    with Pool(args.jobs, initializer=database.engine.dispose) as pool:
+        loaded = sum(pool.imap_unordered(load, jobs))
+
+    if args.defer_indexes:
+        with database.engine.begin() as engine_connection:
+            for table in fact_tables:
+                for index in table.indexes:
+                    index.create(engine_connection)
+
+    with database.engine.begin() as engine_connection:
+        for table in fact_tables:
+            engine_connection.exec_driver_sql(f"ANALYZE {table.name}")
+
+    elapsed = time.monotonic() - start
+    print(f"Loaded {loaded} rows in {elapsed:.1f}s ({loaded / elapsed:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
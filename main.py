@@ -8,13 +8,25 @@ import api.user as user
 import api.expense_type as expense_type
 import api.account as account
 import api.super_admin as super_admin
+import api.instrumentation as instrumentation
+import api.tracing as tracing
+import api.compression as compression
+import api.health as health
+import api.concurrency as concurrency
+import api.idempotency as idempotency
+import api.events as events
+import api.sync as sync
+import api.batch as batch
+from fastapi.concurrency import run_in_threadpool
 
-models.Base.metadata.create_all(bind=database.engine)
-
-app = FastAPI()
+app = FastAPI(default_response_class=tracing.TracedJSONResponse)
 
 origins = ["*"]
 
+app.add_middleware(concurrency.ConcurrencyMiddleware)
+app.add_middleware(
+    idempotency.IdempotencyMiddleware
+)  # Outside the limits, so replays and duplicates hold no slot
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -22,6 +34,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(instrumentation.QueryStatsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 app.include_router(income.router)
 app.include_router(user.router)
@@ -29,6 +44,16 @@ app.include_router(expenditure.router)
 app.include_router(expense_type.router)
 app.include_router(account.router)
 app.include_router(super_admin.router)
+app.include_router(events.router)
+app.include_router(sync.router)
+app.include_router(batch.router)
+app.include_router(health.router)
+
+
+@app.on_event("startup")
+async def warm_up():
+    concurrency.size_threadpool()
+    await run_in_threadpool(health.warm_up)  # Checking the schema and priming the pool
 
 
 @app.get("/")
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+### Settings the api modules read on import, pointing the engine at a throwaway embedded database
+
+os.environ[
+    "KALLABOX_DATABASE_URL"
+] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'kallabox.db')}"
+os.environ.setdefault("KALLABOX_JWT_SECRET", "test-secret")
+os.environ.setdefault("KALLABOX_JWT_EXPIRY", "30")
+os.environ.setdefault("KALLABOX_SERVICE_TOKEN", "test-token")
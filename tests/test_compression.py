@@ -0,0 +1,104 @@
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+import pytest
+import api.compression as compression
+
+large = "kallabox " * 1000
+app = compression.CompressionMiddleware(
+    Starlette(
+        routes=[
+            Route("/large", lambda request: PlainTextResponse(large)),
+            Route("/small", lambda request: PlainTextResponse("kallabox")),
+            Route(
+                "/binary",
+                lambda request: Response(b"\0" * 4096, media_type="image/png"),
+            ),
+        ]
+    )
+)
+client = TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip", "gzip"),
+        ("GZIP", "gzip"),
+        ("gzip;q=0.5", "gzip"),
+        ("gzip; q=0", None),
+        ("gzip;q=0.0, identity", None),
+        ("", None),
+        ("identity", None),
+        ("gzip;q=abc", None),
+        ("gzip;q=", None),
+        ("deflate;q=abc, gzip", "gzip"),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert compression.choose_encoding(accept_encoding) == expected
+
+
+def test_choose_encoding_prefers_the_last_registered():
+    assert compression.choose_encoding("*") == list(compression.compressors)[-1]
+
+
+@pytest.mark.parametrize("refused", list(compression.compressors))
+def test_wildcard_skips_refused_encodings(refused):
+    others = [encoding for encoding in compression.compressors if encoding != refused]
+
+    assert compression.choose_encoding(f"{refused};q=0, *") == (others or [None])[-1]
+    assert compression.choose_encoding(f"*, {refused};q=abc") == (others or [None])[-1]
+
+
+def test_wildcard_with_every_encoding_refused(monkeypatch):
+    monkeypatch.setattr(
+        compression, "compressors", {"gzip": compression.GzipCompressor}
+    )
+
+    assert compression.choose_encoding("gzip;q=0, *") is None
+    assert compression.choose_encoding("*;q=0") is None
+
+
+def test_vary_extends_an_existing_header():
+    assert compression.vary([(b"vary", b"Origin")]) == [
+        (b"vary", b"Origin, Accept-Encoding")
+    ]
+    assert compression.vary([(b"vary", b"accept-encoding")]) == [
+        (b"vary", b"accept-encoding")
+    ]
+
+
+def test_compresses_large_bodies():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.text == large  # Decoded by the client
+
+
+def test_malformed_quality_is_not_a_server_error():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip;q=abc"})
+
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.text == large
+
+
+@pytest.mark.parametrize(
+    "path, accept_encoding",
+    [("/large", "identity"), ("/small", "gzip")],
+)
+def test_uncompressed_variants_vary_on_accept_encoding(path, accept_encoding):
+    response = client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_leaves_other_content_types_alone():
+    response = client.get("/binary", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
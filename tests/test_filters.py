@@ -0,0 +1,88 @@
+from fastapi import HTTPException
+import pytest
+import api.filters as filters
+
+income = filters.listing(filters.income)
+super_admin_income = filters.listing(filters.income, scope=())
+
+
+def rejects(parse, conditions=None, sort=None) -> str:
+    with pytest.raises(HTTPException) as raised:
+        parse(conditions=conditions, sort=sort)
+
+    assert raised.value.status_code == 422
+
+    return raised.value.detail
+
+
+def test_listing_compiles_conditions_and_sort():
+    listing = income(
+        conditions=["amount>=100", "method=in:cash,card", "status=true"],
+        sort="-amount",
+    )
+
+    assert len(listing.criteria) == 3
+    assert "IN" in str(listing.criteria[1])
+    assert str(listing.order[0]) == "income.amount DESC"
+    assert listing.key == (
+        ("amount>=100", "method=in:cash,card", "status=true"),
+        "-amount",
+    )
+
+
+def test_listing_without_parameters():
+    listing = income(conditions=None, sort=None)
+
+    assert listing.criteria == [] and listing.order == []
+
+
+@pytest.mark.parametrize(
+    "condition", ["colour=red", "amount", "amount~100", "=100", "Amount=100"]
+)
+def test_unknown_field_or_malformed_condition(condition):
+    assert "expected a field of" in rejects(income, [condition])
+
+
+@pytest.mark.parametrize("condition", ["status>true", "method<cash", "user>=alice"])
+def test_operator_the_field_does_not_support(condition):
+    assert "only supports = !=" in rejects(income, [condition])
+
+
+def test_in_only_goes_with_equality():
+    assert "in: only goes with = or !=" in rejects(income, ["amount>=in:1,2"])
+
+
+@pytest.mark.parametrize("values", ["", ",", ",,,"])
+def test_empty_in_list(values):
+    assert "expected 1 to" in rejects(income, [f"method=in:{values}"])
+
+
+def test_in_list_limit():
+    values = ",".join(str(amount) for amount in range(filters.max_values))
+
+    assert len(income(conditions=[f"amount=in:{values}"], sort=None).criteria) == 1
+    assert "expected 1 to" in rejects(
+        income, [f"amount=in:{values},{filters.max_values}"]
+    )
+
+
+@pytest.mark.parametrize(
+    "condition", ["amount=abc", "status=yes", "trans_id=1", "timestamp>=yesterday"]
+)
+def test_invalid_value(condition):
+    assert "invalid value" in rejects(income, [condition])
+
+
+@pytest.mark.parametrize("sort", ["amount", "-amount", "timestamp", "-timestamp"])
+def test_sort_backed_by_an_index(sort):
+    assert len(income(conditions=None, sort=sort).order) == 1
+
+
+@pytest.mark.parametrize("sort", ["method", "-user", "status", "colour", "--amount"])
+def test_sort_outside_the_whitelist(sort):
+    assert "Invalid sort" in rejects(income, sort=sort)
+
+
+def test_sort_without_the_account_scope():
+    assert len(super_admin_income(conditions=None, sort="-trans_id").order) == 1
+    assert "Invalid sort" in rejects(super_admin_income, sort="amount")
@@ -0,0 +1,218 @@
+from datetime import datetime
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    ForeignKey,
+    MetaData,
+    String,
+    Table,
+    TIMESTAMP,
+    Uuid,
+    create_engine,
+    insert,
+    select,
+)
+import uuid
+import pytest
+import api.migrations as migrations
+import api.models as models
+import api.names as names
+
+account_id = uuid.uuid4()
+user_id = uuid.uuid4()
+created = datetime(2023, 5, 1, 12, 0)
+
+
+def old_schema() -> MetaData:
+    """Tables as the first release created them, before the names moved to lookups"""
+
+    metadata = MetaData()
+    Table(
+        "accounts",
+        metadata,
+        Column("account_id", Uuid, primary_key=True),
+        Column("account_name", String, nullable=False, unique=True),
+        Column("status", Boolean, nullable=False),
+        Column("timestamp", TIMESTAMP(timezone=True), nullable=False),
+    )
+    Table(
+        "users",
+        metadata,
+        Column("account_id", Uuid, ForeignKey("accounts.account_id"), nullable=False),
+        Column(
+            "account_name",
+            String,
+            ForeignKey("accounts.account_name"),
+            nullable=False,
+        ),
+        Column("user_id", Uuid, primary_key=True),
+        Column("user_name", String, nullable=False, unique=True),
+        Column("email", String, nullable=False),
+        Column("phone", String, nullable=False),
+        Column("acne", String, nullable=False, unique=True),
+        Column("password", String, nullable=False),
+        Column("role", String, nullable=True),
+        Column("timestamp", TIMESTAMP(timezone=True), nullable=False),
+    )
+    Table(
+        "income",
+        metadata,
+        Column("account_id", Uuid, ForeignKey("accounts.account_id"), nullable=False),
+        Column("account_name", String, nullable=False),
+        Column("user_id", Uuid, ForeignKey("users.user_id"), nullable=False),
+        Column("user_name", String, nullable=False),
+        Column("trans_id", Uuid, primary_key=True),
+        Column("amount", BigInteger, nullable=False),
+        Column("method", String, nullable=False),
+        Column("status", Boolean, nullable=False),
+        Column("timestamp", TIMESTAMP(timezone=True), nullable=False),
+    )
+    Table(
+        "expend",
+        metadata,
+        Column("account_id", Uuid, ForeignKey("accounts.account_id"), nullable=False),
+        Column("account_name", String, nullable=False),
+        Column("user_id", Uuid, ForeignKey("users.user_id"), nullable=False),
+        Column("user_name", String, nullable=False),
+        Column("expend_id", Uuid, primary_key=True),
+        Column("amount", BigInteger, nullable=False),
+        Column("expense_type_id", Uuid, nullable=False),
+        Column("status", Boolean, nullable=False),
+        Column("timestamp", TIMESTAMP(timezone=True), nullable=False),
+    )
+
+    return metadata
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    metadata = old_schema()
+    metadata.create_all(engine)
+    tables = metadata.tables
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(tables["accounts"]).values(
+                account_id=account_id,
+                account_name="shop",
+                status=True,
+                timestamp=created,
+            )
+        )
+        connection.execute(
+            insert(tables["users"]).values(
+                account_id=account_id,
+                account_name="shop",
+                user_id=user_id,
+                user_name="alice",
+                email="alice@example.com",
+                phone="9999999999",
+                acne="shop:alice",
+                password="hash",
+                role="account_admin",
+                timestamp=created,
+            )
+        )
+        connection.execute(
+            insert(tables["income"]),
+            [
+                dict(
+                    account_id=account_id,
+                    account_name="shop",
+                    user_id=user_id,
+                    user_name="alice",
+                    trans_id=uuid.uuid4(),
+                    amount=amount,
+                    method=method,
+                    status=True,
+                    timestamp=created,
+                )
+                for amount, method in [(100, "cash"), (250, "card"), (75, "cash")]
+            ],
+        )
+
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_brings_old_schema_up_to_date(engine):
+    assert migrations.missing(engine)
+
+    migrations.upgrade(engine)
+
+    assert migrations.missing(engine) == []
+
+
+def test_upgrade_keeps_rows_and_fills_new_columns(engine):
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(
+                models.Income.amount,
+                models.PaymentMethod.method,
+                models.Income.updated_at,
+            )
+            .join(models.PaymentMethod)
+            .order_by(models.Income.amount)
+        ).all()
+        user = connection.execute(select(models.User.updated_at)).one()
+
+    assert [(amount, method) for amount, method, _ in rows] == [
+        (75, "cash"),
+        (100, "cash"),
+        (250, "card"),
+    ]
+    assert {updated_at.replace(tzinfo=None) for _, _, updated_at in rows} == {created}
+    assert user.updated_at.replace(tzinfo=None) == created
+
+
+def test_new_rows_get_the_time_of_insert(engine):
+    migrations.upgrade(engine)
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(models.User).values(
+                account_id=account_id,
+                account_name="shop",
+                user_id=uuid.uuid4(),
+                user_name="bob",
+                email="bob@example.com",
+                phone="8888888888",
+                acne="shop:bob",
+                password="hash",
+                timestamp=created,
+            )
+        )
+        updated = connection.execute(
+            select(models.User.updated_at).where(models.User.user_name == "bob")
+        ).scalar()
+
+    assert updated.year > 1970  # Not the constant the upgrade added the column with
+
+
+def test_upgrade_twice_changes_nothing(engine):
+    migrations.upgrade(engine)
+    migrations.upgrade(engine)
+
+    with engine.connect() as connection:
+        assert len(connection.execute(select(models.Income.trans_id)).all()) == 3
+        assert len(connection.execute(select(models.PaymentMethod.method)).all()) == 2
+
+    assert migrations.missing(engine) == []
+
+
+def test_upgrade_creates_a_fresh_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+
+    migrations.upgrade(engine)
+
+    assert migrations.missing(engine) == []
+    engine.dispose()
+
+
+def test_check_refuses_an_old_schema(engine):
+    with pytest.raises(RuntimeError, match="python -m api.migrations"):
+        migrations.check(engine)